@@ -0,0 +1,61 @@
+# Shared benchmark helpers - puts training/ on the import path and builds Iris-shaped synthetic data and models
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAINING_DIR = os.path.join(ML_DIR, "training")
+
+# the scripts import each other by bare name, as they do inside the containers
+if TRAINING_DIR not in sys.path:
+    sys.path.insert(0, TRAINING_DIR)
+
+# largest difference allowed between another predictor and Booster.predict - xgboost adds the float32 leaf
+# values up in its own order, so the last bits can differ, anything beyond this is a real mismatch
+TOLERANCE = 1e-5
+
+
+def synthetic_rows(rows, seed=0, missing=0.0):
+    """
+    Iris-shaped rows - 4 float32 features whose means depend on the class, so there is something to learn,
+    and labels over 3 classes. `missing` is the share of feature values set to NaN.
+    """
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 3, rows)
+    features = rng.normal(loc=labels[:, None] * 1.5, scale=1.0, size=(rows, 4)).astype(np.float32)
+    if missing:
+        features[rng.random(features.shape) < missing] = np.nan
+    return features, labels
+
+
+def train_model(rows, num_round, max_depth, seed=0, missing=0.0):
+    """Booster trained on synthetic_rows, and the features it was trained on."""
+    import xgboost as xgb
+
+    features, labels = synthetic_rows(rows, seed, missing)
+    params = {"objective": "multi:softprob", "num_class": 3, "max_depth": max_depth, "eta": 0.1, "tree_method": "hist"}
+    return xgb.train(params, xgb.DMatrix(features, label=labels), num_boost_round=num_round), features
+
+
+def write_shards(directory, rows, shards, seed=0, chunk_rows=250_000):
+    """
+    Headerless label-first CSV shards part-00000.csv ... as prepare_data.py writes them, generated chunk
+    by chunk so the generator stays small however many rows are written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    rows_per_shard = -(-rows // shards)
+
+    for shard in range(shards):
+        remaining = min(rows_per_shard, rows - shard * rows_per_shard)
+
+        with open(os.path.join(directory, f"part-{shard:05d}.csv"), "w", newline="") as f:
+            while remaining > 0:
+                n = min(chunk_rows, remaining)
+                features, labels = synthetic_rows(n, seed=rng)
+                chunk = pd.DataFrame(features)
+                chunk.insert(0, "label", labels)
+                chunk.to_csv(f, index=False, header=False, float_format="%.4f")
+                remaining -= n
@@ -0,0 +1,99 @@
+# Bootstrap interval check and benchmark - compares bootstrap_intervals with a loop that resamples rows and
+# builds one confusion matrix per resample, then times it for test sets of increasing size
+#
+#   python3 benchmarks/bootstrap.py --resamples 10000 --rows 30 100000 1000000
+#
+# Exits non-zero when the intervals differ from the loop by more than --tolerance, or any --rows size takes
+# over --max-seconds.
+
+import argparse
+import sys
+import time
+import numpy as np
+
+from _common import synthetic_rows
+from metrics import bootstrap_intervals
+from schema import LABEL_VOCABULARY
+
+
+def synthetic_confusion(rows, accuracy=0.93, seed=0):
+    """Confusion matrix of rows spread over three classes, right about `accuracy` of the time."""
+    _, y_true = synthetic_rows(rows, seed)
+    rng = np.random.default_rng(seed + 1)
+    wrong = rng.random(rows) > accuracy
+    y_pred = np.where(wrong, (y_true + rng.integers(1, 3, rows)) % 3, y_true)
+    return np.bincount(y_true * 3 + y_pred, minlength=9).reshape(3, 3)
+
+
+def loop_intervals(confusion, resamples, level, seed):
+    """The textbook bootstrap - n rows drawn with replacement per resample, a confusion matrix built from each."""
+    y_true, y_pred = np.divmod(np.repeat(np.arange(9), confusion.ravel()), 3)
+    n = len(y_true)
+    rng = np.random.default_rng(seed)
+
+    accuracy, macro_f1, recall = [], [], []
+    for _ in range(resamples):
+        rows = rng.integers(0, n, n)
+        resample = np.zeros((3, 3))
+        np.add.at(resample, (y_true[rows], y_pred[rows]), 1)
+        tp = np.diag(resample)
+        predicted, support = resample.sum(axis=0), resample.sum(axis=1)
+        accuracy.append(tp.sum() / n)
+        f1_denominator = predicted + support
+        macro_f1.append(np.divide(2 * tp, f1_denominator, out=np.zeros(3), where=f1_denominator > 0).mean())
+        recall.append(np.divide(tp, support, out=np.full(3, np.nan), where=support > 0))
+
+    quantiles = [(1 - level) / 2, (1 + level) / 2]
+    recall = np.array(recall)
+    return {
+        "accuracy": np.nanquantile(accuracy, quantiles),
+        "macro_f1": np.nanquantile(macro_f1, quantiles),
+        "recall": [np.nanquantile(recall[:, i], quantiles) for i in range(3)]
+    }
+
+
+def close(interval, expected, tolerance):
+    return np.allclose([interval["lower"], interval["upper"]], expected, rtol=0, atol=tolerance)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resamples", type=int, default=10_000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[30, 100_000, 1_000_000])
+    parser.add_argument("--level", type=float, default=0.95)
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    # the two bootstraps draw differently, so they agree up to the Monte Carlo error of the percentiles
+    parser.add_argument("--check-rows", type=int, default=2000)
+    parser.add_argument("--check-resamples", type=int, default=10_000)
+    parser.add_argument("--tolerance", type=float, default=0.01)
+
+    args = parser.parse_args()
+
+    confusion = synthetic_confusion(args.check_rows)
+    check = bootstrap_intervals(confusion, LABEL_VOCABULARY, args.check_resamples, args.level, seed=1)
+    expected = loop_intervals(confusion, args.check_resamples, args.level, seed=2)
+    matches = (
+        close(check["accuracy"], expected["accuracy"], args.tolerance)
+        and close(check["macro_f1"], expected["macro_f1"], args.tolerance)
+        and all(close(check["recall"][name], expected["recall"][c], args.tolerance)
+                for c, name in enumerate(LABEL_VOCABULARY))
+    )
+    print(f"Intervals on {args.check_rows} rows within {args.tolerance} of the row resampling loop: {matches}\n")
+
+    failed = not matches
+    print(f"{'rows':>10}{'seconds':>10}{'accuracy CI':>22}")
+    for rows in args.rows:
+        confusion = synthetic_confusion(rows)
+
+        start = time.perf_counter()
+        intervals = bootstrap_intervals(confusion, LABEL_VOCABULARY, args.resamples, args.level)
+        seconds = time.perf_counter() - start
+
+        failed |= seconds > args.max_seconds
+        accuracy_ci = f"[{intervals['accuracy']['lower']:.4f}, {intervals['accuracy']['upper']:.4f}]"
+        print(f"{rows:>10}{seconds:>10.3f}{accuracy_ci:>22}")
+
+    if failed:
+        print(f"\nFAIL: intervals differ from the loop by more than {args.tolerance}, or {args.resamples} "
+              f"resamples took over {args.max_seconds}s")
+        sys.exit(1)
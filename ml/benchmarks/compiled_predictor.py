@@ -0,0 +1,61 @@
+# Compiled predictor benchmark - latency and throughput of Booster.predict vs the compiled tree library
+# at small batch sizes, after checking the two agree
+#
+#   python3 benchmarks/compiled_predictor.py --num-round 150 --max-depth 6 --batch-sizes 1 8 64 512
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import numpy as np
+
+from _common import TOLERANCE, train_model
+from compiled_predictor import BoosterPredictor, CompiledPredictor
+from tree_model import parse_model
+
+
+def time_batches(predictor, features, batch_size, repeats):
+    """Median seconds per predict call over `repeats` batches drawn from the features."""
+    timings = []
+    for i in range(repeats):
+        start_row = (i * batch_size) % (len(features) - batch_size)
+        batch = features[start_row:start_row + batch_size]
+
+        start = time.perf_counter()
+        predictor.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--num-round", type=int, default=150)
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512])
+    parser.add_argument("--repeats", type=int, default=200)
+
+    args = parser.parse_args()
+
+    # a few missing values exercise default_left
+    booster, features = train_model(args.rows, args.num_round, args.max_depth, missing=0.02)
+
+    start = time.perf_counter()
+    compiled = CompiledPredictor(parse_model(json.loads(booster.save_raw("json"))))
+    print(f"Compiled {booster.num_boosted_rounds() * 3} trees in {time.perf_counter() - start:.2f}s ({compiled.lib_path})")
+
+    predictors = {"booster": BoosterPredictor(booster), "compiled": compiled}
+
+    max_diff = np.abs(predictors["compiled"].predict(features) - predictors["booster"].predict(features)).max()
+    print(f"Max abs difference over {len(features)} rows: {max_diff:.2e}")
+    if max_diff > TOLERANCE:
+        print(f"FAIL: compiled predictions differ from the booster by more than {TOLERANCE}")
+        sys.exit(1)
+
+    print(f"\n{'batch':>6}{'predictor':>12}{'latency (us)':>15}{'rows/s':>14}{'speedup':>10}")
+    for batch_size in args.batch_sizes:
+        latencies = {name: time_batches(p, features, batch_size, args.repeats) for name, p in predictors.items()}
+        for name, latency in latencies.items():
+            speedup = latencies["booster"] / latency
+            print(f"{batch_size:>6}{name:>12}{latency * 1e6:>15.1f}{batch_size / latency:>14.0f}{speedup:>9.1f}x")
@@ -0,0 +1,111 @@
+# Memory ceiling benchmark - peak RSS of train.py in-memory vs external memory on synthetic Iris-shaped shards,
+# and the memory building the training matrix alone adds in each mode
+#
+#   python3 benchmarks/external_memory.py --rows 5000000 --max-rss-mb 1500
+#
+# Exits non-zero when the external memory run goes over --max-rss-mb.
+
+import argparse
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+
+from _common import TRAINING_DIR, write_shards
+
+MODES = ("in_memory", "external")
+
+# full train.py runs, or only the training matrix build with train.py's loaders
+STAGES = ("train", "dmatrix")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode, workdir, batch_rows, num_round):
+    """Runs train.py in this process and prints its peak RSS."""
+    sys.argv = [
+        "train.py",
+        "--data-dir", os.path.join(workdir, "train"),
+        "--validation-dir", os.path.join(workdir, "validation"),
+        "--model-dir", os.path.join(workdir, f"model-{mode}"),
+        "--num_round", str(num_round),
+        "--external_memory", str(mode == "external"),
+        "--external_memory_dir", os.path.join(workdir, "cache"),
+        "--batch_rows", str(batch_rows),
+    ]
+    runpy.run_path(os.path.join(TRAINING_DIR, "train.py"), run_name="__main__")
+    print(f"peak_rss_mb={peak_rss_mb():.1f}")
+
+
+def build_child(mode, workdir, batch_rows):
+    """
+    Builds the training matrix the way train.py does and prints the peak RSS the build added on top of
+    the imports. The per-row training state (gradients, predictions) is left out, it is the same in both modes.
+    """
+    from external_memory import load_external_dmatrix
+    from train import load_dmatrix
+
+    train_dir = os.path.join(workdir, "train")
+    before = peak_rss_mb()
+    if mode == "external":
+        load_external_dmatrix(train_dir, os.path.join(workdir, "cache"), batch_rows)
+    else:
+        load_dmatrix(train_dir)
+    print(f"peak_rss_mb={peak_rss_mb() - before:.1f}")
+
+
+def measure(mode, workdir, batch_rows, num_round, stage="train"):
+    """Peak RSS of a fresh process running the stage - all of train.py, or what building the training matrix adds."""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--stage", stage, "--workdir", workdir,
+         "--batch-rows", str(batch_rows), "--num-round", str(num_round)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("peak_rss_mb="):
+            return float(line.split("=")[1])
+    raise RuntimeError(f"No peak_rss_mb reported by the {mode} run:\n{result.stdout[-2000:]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    parser.add_argument("--num-round", type=int, default=10)
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="fail when the external run peaks above this")
+    parser.add_argument("--workdir", type=str, default=None)
+    parser.add_argument("--child", type=str, choices=MODES, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--stage", type=str, choices=STAGES, default="train", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child and args.stage == "dmatrix":
+        build_child(args.child, args.workdir, args.batch_rows)
+        sys.exit(0)
+    if args.child:
+        run_child(args.child, args.workdir, args.batch_rows, args.num_round)
+        sys.exit(0)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="xgb-extmem-")
+    print(f"Writing {args.rows} synthetic rows in {args.shards} shards to {workdir}")
+    write_shards(os.path.join(workdir, "train"), args.rows, args.shards)
+    write_shards(os.path.join(workdir, "validation"), max(args.rows // 10, 1), 1, seed=1)
+
+    peaks = {mode: measure(mode, workdir, args.batch_rows, args.num_round) for mode in MODES}
+    builds = {mode: measure(mode, workdir, args.batch_rows, args.num_round, stage="dmatrix") for mode in MODES}
+
+    print(f"\n{'mode':<12}{'peak RSS (MB)':>15}{'matrix build (MB)':>20}")
+    for mode in MODES:
+        print(f"{mode:<12}{peaks[mode]:>15.1f}{builds[mode]:>20.1f}")
+
+    if args.max_rss_mb is not None and peaks["external"] > args.max_rss_mb:
+        print(f"\nFAIL: external memory run peaked at {peaks['external']:.1f} MB, ceiling is {args.max_rss_mb} MB")
+        sys.exit(1)
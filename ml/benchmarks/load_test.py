@@ -0,0 +1,122 @@
+# Inference server load test - starts serve.py on a synthetic model with batching off (max_batch_rows=1)
+# and on, sends single-row CSV requests from concurrent keep-alive clients, checks the answers against
+# predicting the rows directly and reports latency percentiles and requests per second
+#
+#   python3 benchmarks/load_test.py --clients 64 --requests 4000 --max-wait-ms 2
+#
+# Exits non-zero when a response differs from the direct prediction by more than the tolerance.
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from _common import TOLERANCE, TRAINING_DIR, train_model
+from inference import model_fn
+from model_io import save_model
+
+
+def start_server(model_dir, port, max_batch_rows, max_wait_ms, predictor):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(TRAINING_DIR, "serve.py"), "--model-dir", model_dir, "--host", "127.0.0.1",
+         "--port", str(port), "--max_batch_rows", str(max_batch_rows), "--max_wait_ms", str(max_wait_ms)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env={**os.environ, "INFERENCE_PREDICTOR": predictor}
+    )
+    # serve.py prints one line once it is listening
+    line = process.stdout.readline()
+    if "Serving" not in line:
+        process.kill()
+        raise RuntimeError(f"serve.py did not start: {line}{process.stdout.read()}")
+    return process
+
+
+def stop_server(process):
+    """Stops serve.py with SIGINT and returns its closing line (rows per predict call)."""
+    process.send_signal(signal.SIGINT)
+    output, _ = process.communicate(timeout=30)
+    return output.strip().splitlines()[-1] if output.strip() else ""
+
+
+async def client(port, rows, latencies, responses):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for index in rows:
+        body = responses["bodies"][index]
+        start = time.perf_counter()
+        writer.write(
+            f"POST /invocations HTTP/1.1\r\nContent-Type: text/csv\r\nAccept: text/csv\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+        status = await reader.readline()
+        length = 0
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        payload = await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+
+        if not status.startswith(b"HTTP/1.1 200"):
+            raise RuntimeError(f"{status.decode().strip()}: {payload.decode()}")
+        responses["answers"][index] = np.array(payload.decode().split(","), dtype=np.float64)
+    writer.close()
+
+
+async def run_load(port, features, clients, requests):
+    """Latencies (seconds) and wall time of `requests` single-row requests spread over `clients` connections."""
+    rows = np.arange(requests) % len(features)
+    responses = {
+        "bodies": [",".join(f"{v:.9g}" for v in row).encode("utf-8") for row in features],
+        "answers": {}
+    }
+    latencies = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, rows[c::clients], latencies, responses) for c in range(clients)))
+    return np.array(latencies), time.perf_counter() - start, responses["answers"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-batch-rows", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--predictor", type=str, choices=("booster", "compiled"), default="booster")
+    parser.add_argument("--num-round", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--port", type=int, default=18080)
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        booster, features = train_model(5000, args.num_round, args.max_depth)
+        save_model(booster, model_dir, "json")
+        expected = model_fn(model_dir).predict(features)
+
+        configs = {"unbatched": (1, 0.0), "batched": (args.max_batch_rows, args.max_wait_ms)}
+        failed = False
+        print(f"{'server':<12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'req/s':>10}{'max abs diff':>15}  predict calls")
+        for name, (max_batch_rows, max_wait_ms) in configs.items():
+            process = start_server(model_dir, args.port, max_batch_rows, max_wait_ms, args.predictor)
+            try:
+                latencies, seconds, answers = asyncio.run(run_load(args.port, features, args.clients, args.requests))
+            finally:
+                summary = stop_server(process)
+
+            max_diff = max(np.abs(answer - expected[index]).max() for index, answer in answers.items())
+            failed |= max_diff > TOLERANCE
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{name:<12}{p50:>10.2f}{p99:>10.2f}{len(latencies) / seconds:>10.0f}{max_diff:>15.2e}  {summary}")
+
+    if failed:
+        print(f"\nFAIL: server responses differ from the direct prediction by more than {TOLERANCE}")
+        sys.exit(1)
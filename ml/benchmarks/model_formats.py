@@ -0,0 +1,57 @@
+# Model format benchmark - artifact size, save time, load time and first-predict latency for bst / json / ubj
+#
+#   python3 benchmarks/model_formats.py --num-round 300 --max-depth 6
+#
+# Every load is a fresh Booster, so "first predict" includes the work xgboost defers to the first call,
+# as on an endpoint cold start or at the beginning of evaluate.py.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from _common import train_model
+from model_io import MODEL_FILES, load_model, save_model
+
+
+def measure(booster, model_format, sample, repeats):
+    """Median save, load and first-predict times (ms) and the file size (bytes) for one format."""
+    save_ms, load_ms, predict_ms = [], [], []
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            path = save_model(booster, model_dir, model_format)
+            save_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            loaded = load_model(model_dir)
+            load_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            loaded.inplace_predict(sample)
+            predict_ms.append((time.perf_counter() - start) * 1000)
+
+        size = os.path.getsize(path)
+
+    return size, statistics.median(save_ms), statistics.median(load_ms), statistics.median(predict_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--num-round", type=int, default=300)
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--repeats", type=int, default=5)
+
+    args = parser.parse_args()
+
+    booster, features = train_model(args.rows, args.num_round, args.max_depth)
+    sample = features[:1]
+    print(f"Model: {booster.num_boosted_rounds()} rounds x 3 classes, max_depth {args.max_depth}\n")
+
+    print(f"{'format':<8}{'size (KB)':>12}{'save (ms)':>12}{'load (ms)':>12}{'1st predict (ms)':>18}")
+    for model_format in MODEL_FILES:
+        size, save_ms, load_ms, predict_ms = measure(booster, model_format, sample, args.repeats)
+        print(f"{model_format:<8}{size / 1024:>12.1f}{save_ms:>12.2f}{load_ms:>12.2f}{predict_ms:>18.2f}")
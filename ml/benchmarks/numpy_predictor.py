@@ -0,0 +1,93 @@
+# NumPy predictor parity check and benchmark - trains on the Iris splits, checks NumpyPredictor against
+# Booster.predict on every split, then compares import cost and latency
+#
+#   python3 benchmarks/numpy_predictor.py
+#
+# Exits non-zero when the predictions differ by more than the tolerance.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+
+from _common import ML_DIR, TOLERANCE, TRAINING_DIR
+from numpy_predictor import NumpyPredictor
+from schema import LABEL_COLUMN, encode_chunk
+from tree_model import parse_model
+
+IRIS_CSV = os.path.join(os.path.dirname(ML_DIR), "data", "raw", "Iris.csv")
+
+
+def iris_splits(random_state=42):
+    """60/20/20 stratified train/validation/test split of Iris.csv, as prepare_data.py makes in memory."""
+    df = encode_chunk(pd.read_csv(IRIS_CSV))
+    train, rest = train_test_split(df, train_size=0.6, stratify=df[LABEL_COLUMN], random_state=random_state)
+    validation, test = train_test_split(rest, test_size=0.5, stratify=rest[LABEL_COLUMN], random_state=random_state)
+    return {"train": train, "validation": validation, "test": test}
+
+
+def import_seconds(module):
+    """Wall time of a fresh interpreter importing the module, minus a bare interpreter start."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=TRAINING_DIR)
+        return time.perf_counter() - start
+
+    return statistics.median(run(f"import {module}") for _ in range(3)) - run("pass")
+
+
+def median_seconds(predict, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(X)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-round", type=int, default=50)
+    parser.add_argument("--max-depth", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=200)
+
+    args = parser.parse_args()
+
+    splits = iris_splits()
+    train = splits["train"]
+    params = {"objective": "multi:softprob", "num_class": 3, "max_depth": args.max_depth, "eta": 0.1}
+    booster = xgb.train(params, xgb.DMatrix(train.drop(LABEL_COLUMN, axis=1), label=train[LABEL_COLUMN]), args.num_round)
+
+    predictor = NumpyPredictor(parse_model(json.loads(booster.save_raw("json"))))
+
+    failed = False
+    print(f"{'split':<12}{'rows':>6}{'max abs diff':>15}{'labels equal':>14}")
+    for name, df in splits.items():
+        X = df.drop(LABEL_COLUMN, axis=1)
+        expected = booster.predict(xgb.DMatrix(X))
+        actual = predictor.predict(X.to_numpy())
+
+        max_diff = np.abs(actual - expected).max()
+        labels_equal = bool((actual.argmax(axis=1) == expected.argmax(axis=1)).all())
+        failed |= max_diff > TOLERANCE or not labels_equal
+        print(f"{name:<12}{len(df):>6}{max_diff:>15.2e}{str(labels_equal):>14}")
+
+    X_test = splits["test"].drop(LABEL_COLUMN, axis=1)
+    print(f"\n{'':<22}{'booster':>12}{'numpy':>12}")
+    print(f"{'import (ms)':<22}{import_seconds('xgboost') * 1000:>12.1f}{import_seconds('numpy_predictor') * 1000:>12.1f}")
+    for rows in (1, len(X_test)):
+        X = X_test.iloc[:rows]
+        booster_s = median_seconds(lambda data: booster.predict(xgb.DMatrix(data)), X, args.repeats)
+        numpy_s = median_seconds(predictor.predict, X.to_numpy(), args.repeats)
+        print(f"{f'predict {rows} row(s) (us)':<22}{booster_s * 1e6:>12.1f}{numpy_s * 1e6:>12.1f}")
+
+    if failed:
+        print(f"\nFAIL: NumPy predictions differ from Booster.predict by more than {TOLERANCE}")
+        sys.exit(1)
@@ -0,0 +1,100 @@
+# Sharded evaluation check and benchmark - writes a synthetic sharded test channel, evaluates it file by file
+# in one process and with worker pools of increasing size, checks the merged metrics against a single pass
+# (every row read, predicted and counted at once) and reports the wall time of each
+#
+#   python3 benchmarks/sharded_evaluation.py --rows 2000000 --shards 8 --workers 2 4 8
+#
+# Exits non-zero when any merged evaluation.json differs from the single pass.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import pandas as pd
+
+from _common import train_model, write_shards
+import evaluate
+from metrics import MetricAccumulator
+from model_io import save_model
+from schema import LABEL_COLUMN, LABEL_VOCABULARY, list_data_files, read_split
+
+# logloss is summed exactly per batch, and the batches of a sharded run end elsewhere than the single pass
+LOGLOSS_RTOL = 1e-12
+
+
+def single_pass(model_dir, test_files, predictor):
+    """Reference metrics - the files concatenated, predicted in one call and counted by one accumulator."""
+    df = pd.concat([read_split(path) for path in test_files], ignore_index=True)
+    accumulator = MetricAccumulator(len(LABEL_VOCABULARY))
+    accumulator.update(df[LABEL_COLUMN], evaluate.load_predictor(model_dir, predictor).predict(df.drop(LABEL_COLUMN, axis=1)))
+    return accumulator.evaluation(LABEL_VOCABULARY)
+
+
+def matches(metrics, expected):
+    """Counts and everything derived from them equal, logloss equal up to the rounding of the batch sums."""
+    logloss_close = abs(metrics["logloss"] - expected["logloss"]) <= LOGLOSS_RTOL * abs(expected["logloss"])
+    others = {key: value for key, value in metrics.items() if key != "logloss"}
+    return logloss_close and others == {key: value for key, value in expected.items() if key != "logloss"}
+
+
+def run(model_dir, test_files, predictor, batch_rows, workers):
+    """evaluate.py's evaluation loop - in this process when workers is 1, in a worker pool otherwise."""
+    num_classes = [len(LABEL_VOCABULARY)] * len(test_files)
+    rows = [batch_rows] * len(test_files)
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=evaluate.init_worker,
+            initargs=(model_dir, predictor, 1)
+        ) as pool:
+            states = list(pool.map(evaluate.evaluate_file, test_files, rows, num_classes))
+    else:
+        evaluate.init_worker(model_dir, predictor)
+        states = list(map(evaluate.evaluate_file, test_files, rows, num_classes))
+
+    accumulator = reduce(MetricAccumulator.merge, states, MetricAccumulator(len(LABEL_VOCABULARY)))
+    return accumulator.evaluation(LABEL_VOCABULARY), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--batch-rows", type=int, default=evaluate.DEFAULT_BATCH_ROWS)
+    parser.add_argument("--predictor", type=str, choices=evaluate.PREDICTORS, default="booster")
+    parser.add_argument("--num-round", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=6)
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        model_dir = os.path.join(workdir, "model")
+        test_dir = os.path.join(workdir, "test")
+        os.makedirs(test_dir)
+
+        save_model(train_model(5000, args.num_round, args.max_depth, seed=1)[0], model_dir, "json")
+        write_shards(test_dir, args.rows, args.shards)
+        test_files = list_data_files(test_dir)
+
+        expected = single_pass(model_dir, test_files, args.predictor)
+
+        print(f"{'workers':<10}{'seconds':>10}{'speedup':>10}{'equal':>8}")
+        failed = False
+        single_s = None
+        for workers in [1] + args.workers:
+            metrics, seconds = run(model_dir, test_files, args.predictor, args.batch_rows, workers)
+            single_s = single_s or seconds
+            equal = matches(metrics, expected)
+            failed |= not equal
+            print(f"{workers:<10}{seconds:>10.2f}{single_s / seconds:>10.2f}{str(equal):>8}")
+
+    print(f"\naccuracy {expected['accuracy']:.4f}, logloss {expected['logloss']:.6f} on {args.rows} rows")
+    if failed:
+        print("\nFAIL: merged sharded metrics differ from the single pass")
+        sys.exit(1)
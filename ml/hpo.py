@@ -0,0 +1,216 @@
+# Local hyperparameter search - Hyperband / successive halving over search_space.py on one machine
+#
+#   python3 hpo.py --train-dir channels/train --validation-dir channels/validation
+#
+# Boosting rounds are the fidelity: many configurations get a few rounds, only the best of each rung are
+# promoted and keep boosting from where they stopped. Trials run in a process pool whose workers load the
+# channels once (from the binary DMatrix cache when prepare_data.py --dmatrix-cache wrote one).
+# The winner is written to best_hyperparameters.json for pipeline_terraform.py.
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+import xgboost as xgb
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "training"))
+
+from search_space import FIDELITY, SEARCH_SPACE, sample
+from train import available_cpus, load_dmatrix
+
+STRATEGIES = ("hyperband", "successive_halving")
+DEFAULT_REDUCTION_FACTOR = 3
+BEST_HYPERPARAMETERS_FILE = "best_hyperparameters.json"
+
+# per worker process, set once by init_worker
+_dtrain = None
+_dval = None
+_base_params = None
+
+
+def init_worker(train_dir, validation_dir, nthread, max_bin):
+    global _dtrain, _dval, _base_params
+    _dtrain, _ = load_dmatrix(train_dir, "hist", max_bin, nthread)
+    _dval, _ = load_dmatrix(validation_dir, "hist", max_bin, nthread, ref=_dtrain)
+
+    # same fixed parameters as the SageMaker training job
+    _base_params = {
+        "objective": "multi:softprob",
+        "num_class": 3,
+        "eval_metric": "mlogloss",
+        "tree_method": "hist",
+        "max_bin": max_bin,
+        "nthread": nthread
+    }
+
+
+def run_trial(config, rounds, model_raw=None):
+    """
+    Boosts a configuration up to `rounds` rounds in total, continuing from model_raw (the trial's model
+    after its previous rung). Returns the validation mlogloss of every new round and the raw model.
+    """
+    booster = xgb.Booster(model_file=bytearray(model_raw)) if model_raw else None
+    done = booster.num_boosted_rounds() if booster else 0
+
+    evals_result = {}
+    booster = xgb.train(
+        params={**_base_params, **config},
+        dtrain=_dtrain,
+        num_boost_round=rounds - done,
+        evals=[(_dval, "validation")],
+        evals_result=evals_result,
+        xgb_model=booster,
+        verbose_eval=False
+    )
+    return evals_result["validation"]["mlogloss"], booster.save_raw()
+
+
+class Trial:
+    """One configuration and the validation curve it has produced so far."""
+
+    def __init__(self, trial_id, config):
+        self.trial_id = trial_id
+        self.config = config
+        self.rounds = 0
+        self.history = []
+        self.model_raw = None
+
+    @property
+    def score(self):
+        """mlogloss at the trial's current fidelity - what successive halving ranks on."""
+        return self.history[-1]
+
+    def best_round(self):
+        return int(np.argmin(self.history))
+
+
+def brackets(max_rounds, min_rounds, reduction_factor, strategy):
+    """
+    Hyperband brackets as lists of rungs (number of trials, rounds per trial), most aggressive first.
+    Successive halving runs the most aggressive bracket only.
+    """
+    s_max = int(math.floor(math.log(max_rounds / min_rounds, reduction_factor) + 1e-9))
+    bracket_sizes = range(s_max, -1, -1) if strategy == "hyperband" else [s_max]
+
+    for s in bracket_sizes:
+        n = int(math.ceil((s_max + 1) / (s + 1) * reduction_factor ** s))
+        yield [
+            (max(n // reduction_factor ** i, 1), int(round(max_rounds * reduction_factor ** (i - s))))
+            for i in range(s + 1)
+        ]
+
+
+def run_bracket(pool, rungs, trials):
+    """Runs the rungs of one bracket, promoting the best trials of each rung. Returns the trials of the last rung."""
+    for n_trials, rounds in rungs:
+        # trials are sorted by score after every rung, so promotion keeps the head
+        promoted, pruned = trials[:n_trials], trials[n_trials:]
+        for trial in pruned:
+            trial.model_raw = None
+
+        futures = [pool.submit(run_trial, trial.config, rounds, trial.model_raw) for trial in promoted]
+        for trial, future in zip(promoted, futures):
+            history, trial.model_raw = future.result()
+            trial.history.extend(history)
+            trial.rounds = rounds
+
+        trials = sorted(promoted, key=lambda trial: trial.score)
+        print(f"  rung: {len(trials)} trial(s) x {rounds} rounds - best mlogloss {trials[0].score:.6f} "
+              f"(trial {trials[0].trial_id}: {trials[0].config})")
+
+    return trials
+
+
+def search(train_dir, validation_dir, strategy="hyperband", max_rounds=None, min_rounds=None,
+           reduction_factor=DEFAULT_REDUCTION_FACTOR, workers=None, nthread=0, max_bin=256, seed=42):
+    """Runs the search and returns (best trial, number of trials, boosting rounds spent)."""
+    max_rounds = max_rounds or SEARCH_SPACE[FIDELITY][2]
+    min_rounds = min_rounds or max_rounds / reduction_factor ** 2
+
+    workers = workers or available_cpus()
+    nthread = nthread or max(1, available_cpus() // workers)
+    rng = np.random.default_rng(seed)
+
+    finalists = []
+    trial_count = 0
+    rounds_spent = 0
+
+    print(f"{strategy}: up to {max_rounds} rounds, down to {min_rounds:.0f}, reduction factor {reduction_factor}")
+    print(f"{workers} worker(s) x {nthread} thread(s)")
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(train_dir, validation_dir, nthread, max_bin)
+    ) as pool:
+        for rungs in brackets(max_rounds, min_rounds, reduction_factor, strategy):
+            print(f"\nBracket: {rungs}")
+            trials = [Trial(trial_count + i, sample(rng)) for i in range(rungs[0][0])]
+            trial_count += len(trials)
+
+            finalists.extend(run_bracket(pool, rungs, trials))
+
+            # promoted trials continue boosting, so a rung costs only the rounds added since the previous one
+            previous = 0
+            for n_trials, rounds in rungs:
+                rounds_spent += n_trials * (rounds - previous)
+                previous = rounds
+
+    # rank the trials that ran to max_rounds by their best round, not their last one
+    finalists = [trial for trial in finalists if trial.rounds == max_rounds]
+    best = min(finalists, key=lambda trial: trial.history[trial.best_round()])
+    return best, trial_count, rounds_spent
+
+
+def save_best(best, path, strategy, trial_count, rounds_spent, seconds):
+    """Writes the best trial to best_hyperparameters.json for pipeline_terraform.py. Returns what was written."""
+    # num_round is where the best trial's curve bottomed out, kept inside the tuner's range
+    _, low, high = SEARCH_SPACE[FIDELITY]
+    num_round = min(max(best.best_round() + 1, low), high)
+
+    result = {
+        "hyperparameters": {**best.config, FIDELITY: num_round},
+        "validation:mlogloss": best.history[best.best_round()],
+        "strategy": strategy,
+        "trials": trial_count,
+        "boosting_rounds": rounds_spent,
+        "seconds": seconds
+    }
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train-dir", type=str, required=True, help="train channel (data files, optional DMatrix cache)")
+    parser.add_argument("--validation-dir", type=str, required=True)
+    parser.add_argument("--strategy", type=str, choices=STRATEGIES, default="hyperband")
+    parser.add_argument("--max-rounds", type=int, default=None, help=f"default: the {FIDELITY} upper bound")
+    parser.add_argument("--min-rounds", type=int, default=None, help="default: max-rounds / reduction-factor^2")
+    parser.add_argument("--reduction-factor", type=int, default=DEFAULT_REDUCTION_FACTOR)
+    parser.add_argument("--workers", type=int, default=None, help="default: one per CPU")
+    parser.add_argument("--nthread", type=int, default=0, help="threads per worker, 0 splits the CPUs between workers")
+    parser.add_argument("--max-bin", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=BEST_HYPERPARAMETERS_FILE)
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    best, trial_count, rounds_spent = search(
+        args.train_dir, args.validation_dir, args.strategy, args.max_rounds, args.min_rounds,
+        args.reduction_factor, args.workers, args.nthread, args.max_bin, args.seed
+    )
+    elapsed = time.perf_counter() - start
+
+    result = save_best(best, args.output, args.strategy, trial_count, rounds_spent, elapsed)
+
+    print(f"\n{trial_count} trials, {rounds_spent} boosting rounds in {elapsed:.1f}s")
+    print(f"Best: trial {best.trial_id} {result['hyperparameters']}")
+    print(f"validation:mlogloss={result['validation:mlogloss']};")
+    print(f"Best hyperparameters written to {args.output}")
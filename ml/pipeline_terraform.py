@@ -4,16 +4,19 @@ import sagemaker
 from sagemaker.image_uris import retrieve
 from sagemaker.estimator import Estimator
 from sagemaker.processing import ScriptProcessor, ProcessingInput, ProcessingOutput
-from sagemaker.workflow.steps import TuningStep, ProcessingStep
+from sagemaker.workflow.steps import TuningStep, TrainingStep, ProcessingStep
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.parameters import ParameterInteger, ParameterString
 from sagemaker.tuner import HyperparameterTuner, IntegerParameter, ContinuousParameter
 from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo
 from sagemaker.workflow.condition_step import ConditionStep
-from sagemaker.workflow.functions import JsonGet
+from sagemaker.workflow.execution_variables import ExecutionVariables
+from sagemaker.workflow.functions import Join, JsonGet
 from sagemaker.workflow.properties import PropertyFile
 from sagemaker.workflow.step_collections import RegisterModel
 
+from search_space import SEARCH_SPACE
+
 
 role = os.environ.get(
     "SAGEMAKER_ROLE_ARN",
@@ -37,6 +40,24 @@ pipeline_name = os.environ.get(
 )
 
 MODEL_ARTIFACTS_PREFIX = "model-artifacts"
+CHECKPOINTS_PREFIX = "checkpoints"
+
+# best_hyperparameters.json from hpo.py - when set, a single training job replaces the tuner
+best_hyperparameters_file = os.environ.get("BEST_HYPERPARAMETERS", "")
+
+# model.tar.gz of an earlier run - when set, train.py keeps boosting it on the new data instead of starting over
+warm_start_model_uri = os.environ.get("WARM_START_MODEL_URI", "")
+warm_start_rounds = int(os.environ.get("WARM_START_ROUNDS", "20"))
+
+# managed spot training, opt in - train.py checkpoints to /opt/ml/checkpoints and resumes after a reclaim
+use_spot_instances = os.environ.get("USE_SPOT_INSTANCES", "false").lower() == "true"
+
+# k-fold cross-validation over train + validation, opt in. It replaces the single validation split, so
+# train.py reports the cross-validated rounds instead of validation:best_iteration - the two never run together
+cv_folds = int(os.environ.get("CV_FOLDS", "0"))
+
+# gate registration on the lower bound of evaluate.py's bootstrap accuracy interval instead of the point estimate
+gate_on_accuracy_lower_bound = os.environ.get("GATE_ON_ACCURACY_LOWER_BOUND", "false").lower() == "true"
 
 print(f"Generating Pipeline definition with: ")
 print(f" Region: {region}")
@@ -75,22 +96,49 @@ estimator = Estimator(
     hyperparameters={
         "objective" : "multi:softprob",
         "num_class" : 3,
+        "tree_method" : "hist",
+        "max_bin" : 256,
+        "early_stopping_rounds" : 10,
+        "checkpoint_interval" : 10,
+        "cv_folds" : cv_folds,
     },
     volume_size=5,
-    max_run=3600
+    max_run=3600,
+    use_spot_instances=use_spot_instances,
+    # max_wait covers max_run plus the time spent waiting for spot capacity
+    max_wait=7200 if use_spot_instances else None,
+    # one prefix per pipeline execution - a later run must not resume the last run's checkpoints
+    checkpoint_s3_uri=Join(on="/", values=[f"s3://{bucket}/{CHECKPOINTS_PREFIX}", ExecutionVariables.PIPELINE_EXECUTION_ID]),
+    checkpoint_local_path="/opt/ml/checkpoints"
 )
 
-# Hyperparameter Ranges
+# Hyperparameter Ranges (search_space.py, shared with hpo.py)
 hyperparam_ranges = {
-    "max_depth" : IntegerParameter(3,10),
-    "eta" : ContinuousParameter(0.01, 0.3),
-    "num_round" : IntegerParameter(30,150)
+    name : (IntegerParameter if kind == "int" else ContinuousParameter)(low, high)
+    for name, (kind, low, high) in SEARCH_SPACE.items()
 }
 
 metric_definitions = [
-    { "Name" : "validation:mlogloss" , "Regex" : r"validation:mlogloss=([\d\.]+)" }
+    { "Name" : "validation:mlogloss" , "Regex" : r"validation:mlogloss=([\d\.]+)" },
+    # training profile (ProfilingCallback in train.py)
+    { "Name" : "profile:train_data_load_seconds" , "Regex" : r"profile:train_data_load_seconds=([\d\.]+)" },
+    { "Name" : "profile:train_dmatrix_seconds" , "Regex" : r"profile:train_dmatrix_seconds=([\d\.]+)" },
+    { "Name" : "profile:validation_data_load_seconds" , "Regex" : r"profile:validation_data_load_seconds=([\d\.]+)" },
+    { "Name" : "profile:validation_dmatrix_seconds" , "Regex" : r"profile:validation_dmatrix_seconds=([\d\.]+)" },
+    { "Name" : "profile:round_wall_seconds" , "Regex" : r"round_wall_seconds=([\d\.]+)" },
+    { "Name" : "profile:round_cpu_seconds" , "Regex" : r"round_cpu_seconds=([\d\.]+)" },
+    { "Name" : "profile:rss_mb" , "Regex" : r"rss_mb=([\d\.]+)" }
 ] 
 
+# only the metrics the chosen validation mode prints
+if cv_folds > 1:
+    metric_definitions += [
+        { "Name" : "validation:mlogloss_std" , "Regex" : r"validation:mlogloss_std=([\d\.]+)" },
+        { "Name" : "validation:cv_rounds" , "Regex" : r"validation:cv_rounds=(\d+)" }
+    ]
+else:
+    metric_definitions.append({ "Name" : "validation:best_iteration" , "Regex" : r"validation:best_iteration=(\d+)" })
+
 # Hyperparameter Tuner
 tuner = HyperparameterTuner(
     estimator=estimator,
@@ -102,15 +150,37 @@ tuner = HyperparameterTuner(
     max_parallel_jobs=3
 )
 
-# Tuning Step
-tuning_step = TuningStep(
-    name="TfTunedXGBoostModel",
-    tuner=tuner,
-    inputs={
-        "train" : f"s3://{bucket}/data/train/",
-        "validation" : f"s3://{bucket}/data/validation/"
-    }
-)
+training_inputs = {
+    "train" : f"s3://{bucket}/data/train/",
+    "validation" : f"s3://{bucket}/data/validation/"
+}
+
+if warm_start_model_uri:
+    print(f" Warm start from: {warm_start_model_uri} (+{warm_start_rounds} rounds)")
+    training_inputs["model"] = warm_start_model_uri
+    estimator.set_hyperparameters(warm_start_rounds=warm_start_rounds)
+
+if best_hyperparameters_file:
+    # Training Step - hyperparameters already chosen locally by hpo.py
+    with open(best_hyperparameters_file) as f:
+        best_hyperparameters = json.load(f)["hyperparameters"]
+    print(f" Best hyperparameters: {best_hyperparameters}")
+
+    estimator.set_hyperparameters(**best_hyperparameters)
+    model_step = TrainingStep(
+        name="TfTrainXGBoostModel",
+        estimator=estimator,
+        inputs=training_inputs
+    )
+    model_data = model_step.properties.ModelArtifacts.S3ModelArtifacts
+else:
+    # Tuning Step
+    model_step = TuningStep(
+        name="TfTunedXGBoostModel",
+        tuner=tuner,
+        inputs=training_inputs
+    )
+    model_data = model_step.get_top_model_s3_uri(top_k=0, s3_bucket=bucket, prefix=MODEL_ARTIFACTS_PREFIX)
 
 # Script Processor
 script_processor = ScriptProcessor(
@@ -135,12 +205,17 @@ evaluation_step = ProcessingStep(
     processor= script_processor,
     inputs= [
         ProcessingInput(
-            source=tuning_step.get_top_model_s3_uri(top_k=0, s3_bucket=bucket, prefix= MODEL_ARTIFACTS_PREFIX),
+            source=model_data,
             destination="/opt/ml/processing/model"
         ),
         ProcessingInput(
             source=f"s3://{bucket}/data/test/",
             destination="/opt/ml/processing/test"
+        ),
+        # shared modules evaluate.py imports (schema.py)
+        ProcessingInput(
+            source="training",
+            destination="/opt/ml/processing/source"
         )
     ],
     outputs=[
@@ -159,7 +234,7 @@ evaluation_step = ProcessingStep(
 register_step = RegisterModel(
     name="RegisterBestModel",
     estimator=estimator,
-    model_data=tuning_step.get_top_model_s3_uri(top_k=0, s3_bucket=bucket, prefix=MODEL_ARTIFACTS_PREFIX),
+    model_data=model_data,
     content_types=["text/csv"],
     response_types=["text/csv"],
     inference_instances=["ml.m5.large", "ml.t2.medium"],
@@ -173,7 +248,7 @@ accuracy_condition = ConditionGreaterThanOrEqualTo(
     left=JsonGet(
         step_name=evaluation_step.name,
         property_file=evaluation_report,
-        json_path="accuracy"
+        json_path="confidence_intervals.accuracy.lower" if gate_on_accuracy_lower_bound else "accuracy"
     ),
     right=0.90
 )
@@ -190,7 +265,7 @@ condition_step = ConditionStep(
 pipeline = Pipeline(
     name=pipeline_name,
     parameters=[num_round_param, instance_type_param],
-    steps=[tuning_step, evaluation_step, condition_step],
+    steps=[model_step, evaluation_step, condition_step],
     sagemaker_session=session
 )
 
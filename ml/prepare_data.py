@@ -1,128 +1,836 @@
 # Data Prep - Splits Iris.csv into Train(60%), Validation (20%) & Test(20%)
 
+import argparse
+import json
+import sqlite3
+import sys
 import pandas as pd
+import numpy as np
 from sklearn.model_selection import train_test_split
 import os
 import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+# shared modules live with the training scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "training"))
+
+from schema import FEATURE_COLUMNS, LABEL_COLUMN, encode_chunk, file_sha256
+
+# rows per chunk in streaming mode - bounds peak memory regardless of file size
+DEFAULT_CHUNKSIZE = 100_000
+
+# golden ratio conjugate - low discrepancy sequence used to spread rows over the splits
+_GOLDEN_RATIO = 0.6180339887498949
+
+SPLIT_NAMES = ("train", "validation", "test")
+
+# input sources
+#   csv    - data/raw/iris.csv
+#   sqlite - Iris table in data/database.sqlite, optionally only rows past the last processed Id
+SOURCES = ("csv", "sqlite")
+DEFAULT_SQLITE_TABLE = "Iris"
+
+# split strategies
+#   random - train_test_split in memory / shuffled golden ratio placement when streaming
+#   hash   - split is a pure function of the row key, so new rows never move existing ones
+SPLIT_STRATEGIES = ("random", "hash")
+
+# fixed 16 byte key for pd.util.hash_pandas_object - changing it reshuffles every hash split
+_HASH_KEY = "iris-split-v1-00"
+
+# max allowed gap between a class's share in a split and the configured ratio (hash strategy). A hash split
+# is a random draw, so a class of n rows lands in a split of ratio r with a spread of sqrt(r(1-r)/n) -
+# 0.07 for the 60% train split of a 50 row Iris class and far less on real data sizes. 0.10 rejects the Id
+# hash of Iris, whose test split takes 3 of 50 versicolor rows (0.14 off)
+DEFAULT_STRATIFY_TOLERANCE = 0.10
+
+# split file formats
+#   csv     - headerless text, label first (what the stock container expects)
+#   parquet - typed columnar file, float32 features and int8 label
+OUTPUT_FORMATS = ("csv", "parquet")
+PARQUET_SCHEMA = pa.schema([(LABEL_COLUMN, pa.int8())] + [(col, pa.float32()) for col in FEATURE_COLUMNS])
+
+# rows of every class are dealt round robin over the shards, so each part-NNNNN file is stratified
+DEFAULT_NUM_SHARDS = 1
+
+# S3 upload tuning - part size for multipart uploads and parallel parts per object
+DEFAULT_MULTIPART_CHUNKSIZE_MB = 8
+DEFAULT_MAX_CONCURRENCY = 10
+
+# manifest of which source rows went to which split, kept locally and next to the data in S3
+# (outside data/train/ so updating it does not fire the EventBridge rule)
+MANIFEST_FILE = "manifest.json"
+MANIFEST_S3_KEY = "data/manifest.json"
+
+# upper bound on files uploaded at the same time (sharded splits can produce many)
+MAX_PARALLEL_UPLOADS = 16
+
+# object metadata key holding the sha256 of the uploaded file (x-amz-meta-content-sha256)
+DIGEST_METADATA_KEY = "content-sha256"
+
+
+class SplitWriter:
+    """Appends encoded chunks of one split to a csv or parquet file."""
+
+    def __init__(self, path, output_format="csv"):
+        self.path = path
+        self.paths = [path]
+        self.output_format = output_format
+        self.rows = 0
+        self._csv_file = None
+        self._parquet_writer = None
+
+    def write(self, df):
+        self.rows += len(df)
+        if self.output_format == "parquet":
+            # chunks are already int8/float32 from encode_chunk
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            if self._csv_file is None:
+                self._csv_file = open(self.path, "w", newline="")
+            # saving without header as per container expectations
+            df.to_csv(self._csv_file, index=False, header=False)
+
+    def rows_per_path(self):
+        return {self.path: self.rows}
+
+    def close(self):
+        if self.output_format == "parquet":
+            if self._parquet_writer is None:
+                # empty split still needs a readable file, loaders skip it
+                self._parquet_writer = pq.ParquetWriter(self.path, PARQUET_SCHEMA)
+            self._parquet_writer.close()
+        else:
+            if self._csv_file is None:
+                self._csv_file = open(self.path, "w", newline="")
+            self._csv_file.close()
+
+
+class ShardedSplitWriter:
+    """Spreads one split over num_shards part-NNNNN files of roughly equal size, round robin per class."""
+
+    def __init__(self, directory, num_shards, output_format="csv"):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"part-{shard:05d}.{output_format}") for shard in range(num_shards)]
+        self._shards = [SplitWriter(path, output_format) for path in self.paths]
+        self._class_counts = {}
+
+    @property
+    def rows(self):
+        return sum(shard.rows for shard in self._shards)
+
+    def rows_per_path(self):
+        return {shard.path: shard.rows for shard in self._shards}
+
+    def write(self, df):
+        labels = df[LABEL_COLUMN].to_numpy()
+        shard_ids = np.empty(len(df), dtype=np.int64)
+
+        for label in np.unique(labels):
+            mask = labels == label
+            seen = self._class_counts.get(label, 0)
+            shard_ids[mask] = (seen + np.arange(mask.sum())) % len(self._shards)
+            self._class_counts[label] = seen + int(mask.sum())
+
+        for shard_idx, shard in enumerate(self._shards):
+            shard.write(df[shard_ids == shard_idx])
+
+    def close(self):
+        for shard in self._shards:
+            shard.close()
+
+
+def assign_stratified(labels, class_counts, train_ratio, val_ratio):
+    """
+    Assigns each row to a split (0 = train, 1 = validation, 2 = test) without seeing the whole dataset.
+
+    Every class keeps its own running row count in class_counts. The n-th row of a class is placed by
+    the n-th point of a golden ratio sequence, which fills [0, 1) evenly, so each class converges to
+    the configured ratios within a row or two no matter how many chunks it is spread across.
+    """
+    assignment = np.empty(len(labels), dtype=np.int8)
+    bounds = np.array([train_ratio, train_ratio + val_ratio])
+
+    for label in np.unique(labels):
+        mask = labels == label
+        seen = class_counts.get(label, 0)
+        positions = np.arange(seen + 1, seen + 1 + mask.sum())
+        assignment[mask] = np.searchsorted(bounds, (positions * _GOLDEN_RATIO) % 1.0, side="right")
+        class_counts[label] = seen + int(mask.sum())
+
+    return assignment
+
+
+def row_hashes(df, key_column="Id"):
+    """Stable uint64 hash per raw row, of key_column or of the whole row (minus Id) when key_column is None."""
+    if key_column is not None:
+        if key_column not in df.columns:
+            raise ValueError(f"Hash key column '{key_column}' not found")
+        source = df[key_column].astype(str)
+    else:
+        source = df.drop(columns="Id", errors="ignore").astype(str)
+
+    # values as strings so the hash does not depend on the dtype pandas inferred for this chunk
+    return pd.util.hash_pandas_object(source, index=False, hash_key=_HASH_KEY).to_numpy()
+
+
+def assign_by_hash(df, train_ratio, val_ratio, key_column="Id"):
+    """
+    Assigns each row to a split (0 = train, 1 = validation, 2 = test) from a stable hash of key_column,
+    or of the whole row (minus Id) when key_column is None. Must run on raw rows, before Id is dropped.
+
+    A row always hashes to the same split, so appending data only appends to the splits.
+    """
+    hashes = row_hashes(df, key_column)
+    bounds = np.array([train_ratio, train_ratio + val_ratio])
+
+    return np.searchsorted(bounds, hashes / 2.0**64, side="right").astype(np.int8)
+
+
+def check_stratification(split_counts, ratios, tolerance):
+    """Raises if any class's share of a split drifts more than tolerance from the configured ratio."""
+    counts = pd.concat(split_counts, axis=1).fillna(0)
+    shares = counts.div(counts.sum(axis=1), axis=0)
+    drift = (shares - np.asarray(ratios)).abs()
+
+    if (drift > tolerance).any().any():
+        worst = drift.max(axis=1)
+        raise ValueError(
+            f"Hash split is outside the stratification tolerance of {tolerance} "
+            f"(max drift per class: {worst.round(3).to_dict()}). "
+            f"Use a different hash key or raise the tolerance."
+        )
+
+
+def sqlite_max_id(sqlite_path, table=DEFAULT_SQLITE_TABLE):
+    """Highest Id in the table, 0 when it is empty."""
+    if not table.isidentifier():
+        raise ValueError(f"Invalid table name '{table}'")
+
+    conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    try:
+        return conn.execute(f'SELECT MAX(Id) FROM "{table}"').fetchone()[0] or 0
+    finally:
+        conn.close()
+
+
+def iter_sqlite_chunks(sqlite_path, table=DEFAULT_SQLITE_TABLE, batch_size=DEFAULT_CHUNKSIZE, after_id=0, up_to_id=None):
+    """
+    Yields DataFrames of at most batch_size rows with after_id < Id <= up_to_id, in Id order.
+
+    The cursor steps through the query result and fetchmany pulls one batch at a time, so only a
+    single batch is ever held in memory. The connection is read only.
+    """
+    if not table.isidentifier():
+        raise ValueError(f"Invalid table name '{table}'")
+
+    query = f'SELECT * FROM "{table}" WHERE Id > ?'
+    params = [after_id]
+    if up_to_id is not None:
+        query += " AND Id <= ?"
+        params.append(up_to_id)
+    query += " ORDER BY Id"
+
+    conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        conn.close()
+
+
+def load_watermark(path, table):
+    """
+    Last processed Id for the table and the per class row counts of the random strategy up to it,
+    (0, {}) when nothing was processed yet.
+    """
+    if not os.path.exists(path):
+        return 0, {}
+    with open(path) as f:
+        watermark = json.load(f).get(table, 0)
+
+    # watermarks written before the class counts were kept are a bare Id
+    if isinstance(watermark, int):
+        return watermark, {}
+    return watermark["last_id"], {int(label): count for label, count in watermark["class_counts"].items()}
+
+
+def save_watermark(path, table, last_id, class_counts=None):
+    watermarks = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            watermarks = json.load(f)
+    watermarks[table] = {
+        "last_id": int(last_id),
+        "class_counts": {str(label): int(count) for label, count in (class_counts or {}).items()}
+    }
+
+    with open(path, "w") as f:
+        json.dump(watermarks, f, indent=2)
+
+
+class SplitManifest:
+    """
+    Record of every source row already split (by key_column, or row content hash) and of the
+    objects uploaded for it. Reruns only split rows missing from the manifest and upload them as
+    new run-NNNNN objects, so prep time and upload volume follow the size of the delta.
+    """
+
+    def __init__(self, key_column="Id", data=None):
+        data = data or {}
+        if data and data.get("key_column") != key_column:
+            raise ValueError(
+                f"Manifest was built with key column '{data.get('key_column')}', not '{key_column}'"
+            )
+
+        self.key_column = key_column
+        self.runs = data.get("runs", 0)
+        self.rows = {split: list(keys) for split, keys in data.get("rows", {}).items()}
+        self.objects = data.get("objects", {})
+        # per class row counts for the random strategy, so its ratios carry over between runs
+        self.class_counts = {int(label): count for label, count in data.get("class_counts", {}).items()}
+
+        self._seen = {key for keys in self.rows.values() for key in keys}
+
+    def __len__(self):
+        return len(self._seen)
+
+    @classmethod
+    def load(cls, path, s3=None, bucket=None, key_column="Id"):
+        """Reads the local manifest, falling back to the copy in S3, or starts an empty one."""
+        if not os.path.exists(path) and s3 is not None:
+            try:
+                s3.download_file(bucket, MANIFEST_S3_KEY, path)
+                print(f"Fetched manifest from s3://{bucket}/{MANIFEST_S3_KEY}")
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                    raise
+
+        if not os.path.exists(path):
+            return cls(key_column)
+
+        with open(path) as f:
+            return cls(key_column, json.load(f))
+
+    def row_keys(self, df):
+        if self.key_column is not None:
+            if self.key_column not in df.columns:
+                raise ValueError(f"Manifest key column '{self.key_column}' not found")
+            return df[self.key_column].astype(str).to_numpy()
+        return np.char.mod("%016x", row_hashes(df, None))
+
+    def new_rows(self, df):
+        """Rows of a raw chunk not split yet, indexed by their manifest key."""
+        df = df.set_axis(self.row_keys(df), axis=0)
+        return df[~df.index.isin(self._seen)]
+
+    def record_rows(self, split, keys):
+        keys = list(keys)
+        self.rows.setdefault(split, []).extend(keys)
+        self._seen.update(keys)
+
+    def record_object(self, s3_key, sha256, rows):
+        self.objects[s3_key] = {"sha256": sha256, "rows": rows, "run": self.runs}
+
+    def to_dict(self):
+        return {
+            "version": 1,
+            "key_column": self.key_column,
+            "runs": self.runs,
+            "class_counts": {str(label): count for label, count in self.class_counts.items()},
+            "objects": self.objects,
+            "rows": self.rows
+        }
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+def stream_three_way_split(chunks, outputs, train_ratio, val_ratio, random_state,
+                           split_strategy="random", hash_key_column="Id", manifest=None, class_counts=None):
+    """
+    Streaming version of the three way split - takes an iterator of raw DataFrame chunks and
+    appends every chunk to the train/validation/test writers as it goes. Returns per split label counts.
+
+    With a manifest, rows it already holds are skipped and the new rows are recorded in it.
+    class_counts carries the random strategy's per class counts over from an earlier run (the manifest
+    keeps its own) and is updated in place.
+    """
+    rng = np.random.default_rng(random_state)
+    if manifest is not None:
+        class_counts = manifest.class_counts
+    elif class_counts is None:
+        class_counts = {}
+    split_counts = [pd.Series(dtype="int64") for _ in outputs]
+
+    try:
+        for chunk in chunks:
+            if manifest is not None:
+                chunk = manifest.new_rows(chunk)
+                if chunk.empty:
+                    continue
+
+            if split_strategy == "hash":
+                assignment = assign_by_hash(chunk, train_ratio, val_ratio, key_column=hash_key_column)
+                chunk = encode_chunk(chunk)
+            else:
+                chunk = encode_chunk(chunk)
+
+                # shuffling inside the chunk so sorted input does not end up in the same split
+                chunk = chunk.iloc[rng.permutation(len(chunk))]
+                assignment = assign_stratified(chunk[LABEL_COLUMN].to_numpy(), class_counts, train_ratio, val_ratio)
+
+            for split_idx, output in enumerate(outputs):
+                split_df = chunk[assignment == split_idx]
+                output.write(split_df)
+                if manifest is not None:
+                    manifest.record_rows(SPLIT_NAMES[split_idx], split_df.index)
+                split_counts[split_idx] = split_counts[split_idx].add(split_df[LABEL_COLUMN].value_counts(), fill_value=0)
+    finally:
+        for output in outputs:
+            output.close()
+
+    return [counts.astype(int).sort_index() for counts in split_counts]
+
+
+def upload_if_changed(s3, path, bucket, key, transfer_config, digest=None):
+    """
+    Uploads path to s3://bucket/key unless the object already carries the same content digest.
+    Returns True when the file was uploaded, False when it was skipped.
+    """
+    digest = digest or file_sha256(path)
+
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+        if head.get("Metadata", {}).get(DIGEST_METADATA_KEY) == digest:
+            return False
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+            raise
+
+    s3.upload_file(
+        path,
+        bucket,
+        key,
+        ExtraArgs={"Metadata": {DIGEST_METADATA_KEY: digest}},
+        Config=transfer_config
+    )
+    return True
+
+
+def upload_splits(uploads, bucket, multipart_chunksize_mb=DEFAULT_MULTIPART_CHUNKSIZE_MB, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                  digests=None):
+    """
+    Uploads {local_path: s3_key} concurrently, a thread per file (up to MAX_PARALLEL_UPLOADS) plus max_concurrency multipart
+    threads per object. Unchanged objects are skipped, so they do not fire the EventBridge trigger.
+    digests optionally maps local_path to an already computed sha256. Returns {s3_key: uploaded}.
+    """
+    digests = digests or {}
+    # boto3 clients are thread safe, sessions/resources are not
+    s3 = boto3.client("s3")
+    chunksize = multipart_chunksize_mb * 1024 * 1024
+    transfer_config = TransferConfig(
+        multipart_threshold=chunksize,
+        multipart_chunksize=chunksize,
+        max_concurrency=max_concurrency
+    )
+
+    with ThreadPoolExecutor(max_workers=min(len(uploads), MAX_PARALLEL_UPLOADS)) as pool:
+        futures = {
+            key: pool.submit(upload_if_changed, s3, path, bucket, key, transfer_config, digests.get(path))
+            for path, key in uploads.items()
+        }
+        uploaded = {key: future.result() for key, future in futures.items()}
+
+    for key, was_uploaded in uploaded.items():
+        status = "Uploaded" if was_uploaded else "Skipped (unchanged)"
+        print(f" {status}: s3://{bucket}/{key}")
+
+    return uploaded
+
+
+def delete_stale_objects(bucket, keep, prefixes):
+    """
+    Deletes every object under the given prefixes whose key is not in keep - the channels read every
+    file they hold, so an object a newer run replaced would otherwise be trained on twice.
+    Returns the deleted keys.
+    """
+    s3 = boto3.client("s3")
+    paginator = s3.get_paginator("list_objects_v2")
+
+    stale = [
+        obj["Key"]
+        for prefix in prefixes
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"] not in keep
+    ]
+
+    # delete_objects takes at most 1000 keys per call
+    for start in range(0, len(stale), 1000):
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in stale[start:start + 1000]], "Quiet": True}
+        )
+
+    for key in stale:
+        print(f" Deleted (stale): s3://{bucket}/{key}")
+
+    return stale
+
+
+def prepare_three_way_split(streaming=False, chunksize=DEFAULT_CHUNKSIZE, split_strategy="random",
+                            hash_key_column="Id", stratify_tolerance=DEFAULT_STRATIFY_TOLERANCE,
+                            multipart_chunksize_mb=DEFAULT_MULTIPART_CHUNKSIZE_MB, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                            output_format="csv", num_shards=DEFAULT_NUM_SHARDS, source="csv",
+                            sqlite_table=DEFAULT_SQLITE_TABLE, incremental=False, use_manifest=False,
+                            dmatrix_cache=False):
 
-def prepare_three_way_split():  
-    
 
     input_file = os.path.join("data", "raw", "iris.csv") #path to original iris.csv
+    sqlite_path = os.path.join("data", "database.sqlite") #same Iris data, written by the upstream system
     output_dir = "split_data" #directory to save files
-    
+    watermark_path = os.path.join(output_dir, "sqlite_watermark.json") #last Id processed per table
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE) #rows already split + uploaded objects
+
     train_ratio = 0.6 # training ratio - default 60%
     val_ratio = 0.2 # validation ratio - default 20%
     test_ratio = 0.2 # test ratio - default 20%
     random_state = 42
-    
+
     # validating split ratios
     if abs(train_ratio + val_ratio + test_ratio - 1.0) > 0.001:
         raise ValueError("Ratios must sum up to 1")
 
+    if split_strategy not in SPLIT_STRATEGIES:
+        raise ValueError(f"Unknown split strategy '{split_strategy}', expected one of {SPLIT_STRATEGIES}")
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+
+    if num_shards < 1:
+        raise ValueError("num_shards must be at least 1")
+
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source '{source}', expected one of {SOURCES}")
+
+    if incremental and source != "sqlite":
+        raise ValueError("Incremental mode needs the sqlite source")
+
+    if incremental and use_manifest:
+        raise ValueError("Use either the sqlite watermark or the manifest to track processed rows, not both")
+
+    # a cache has to cover every file in the channel, a delta run only sees the new ones
+    if dmatrix_cache and (incremental or use_manifest):
+        raise ValueError("DMatrix caches can only be built from full (non incremental) runs")
+
     os.makedirs(output_dir, exist_ok=True)
 
-    #loading data
-    try:
-        df = pd.read_csv(input_file)
-    except FileNotFoundError:
-        print(f"Dataset {input_file} not found")
-        return 
-    
-    print(f"Total Samples: {len(df)}")
-    print(f"Total Columns: {len(df.columns)}")
-
-    # Checking for Species
-    if 'Species' not in df.columns:
-        raise ValueError("'Species' Column not found")
-    
-    #print class distribution
-    print(f" Original Class Distribution:  {df['Species'].value_counts().sort_index()}")
-
-    # dropping Id cause container expects only label and features
-    if "Id" in df.columns:
-        df = df.drop(columns="Id")
-        
-     # Convert Species to numeric labels
-    label_mapping = {
-        "Iris-setosa": 0,
-        "Iris-versicolor": 1,
-        "Iris-virginica": 2
-    }
+    bucket = os.environ.get("S3_BUCKET", "terraform-sagemaker-firstbucket")
 
-    df["Species"] = df["Species"].map(label_mapping)
+    # saving datasets
+    train_path = os.path.join(output_dir, f"iris_train.{output_format}")
+    val_path = os.path.join(output_dir, f"iris_validation.{output_format}")
+    test_path = os.path.join(output_dir, f"iris_test.{output_format}")
 
-    if df["Species"].isnull().any():
-        raise ValueError("Label mapping failed. Unexpected Species values found.")
+    # sharded splits go to split_data/<split>/part-NNNNN.<format> instead
+    if num_shards > 1:
+        train_path, val_path, test_path = (os.path.join(output_dir, split) for split in SPLIT_NAMES)
+        outputs = [ShardedSplitWriter(path, num_shards, output_format) for path in (train_path, val_path, test_path)]
+    else:
+        outputs = [SplitWriter(path, output_format) for path in (train_path, val_path, test_path)]
 
-    # Reorder columns: label first
-    cols = ["Species"] + [col for col in df.columns if col != "Species"]
-    df = df[cols]
+    source_path = sqlite_path if source == "sqlite" else input_file
+    if not os.path.exists(source_path):
+        print(f"Dataset {source_path} not found")
+        return
 
-    print("Label distribution:")
-    print(df["Species"].value_counts().sort_index())
+    # sqlite rows (watermark, max_id] - max_id is read up front so rows written during the run wait for the next one
+    watermark = max_id = 0
+    class_counts = {}
+    if source == "sqlite":
+        watermark, class_counts = load_watermark(watermark_path, sqlite_table) if incremental else (0, {})
+        max_id = sqlite_max_id(sqlite_path, sqlite_table)
 
-    # Splitting Dataset - Separating Test Set - MUST BE UNSEEN
-    train_val_df, test_df = train_test_split(
-        df,
-        test_size= test_ratio,
-        random_state= random_state,
-        stratify=df["Species"]
-    )
+        if max_id <= watermark:
+            print(f"No new rows in {sqlite_table} since Id {watermark}, nothing to prepare")
+            return
 
-    val_ratio_adjusted = val_ratio / (train_ratio + val_ratio)
+        print(f"Reading {sqlite_table} rows with Id in ({watermark}, {max_id}] from {sqlite_path}")
 
-    # Splitting train_val_df into Train and Validation sets
-    train_df, val_df = train_test_split(
-        train_val_df,
-        test_size= val_ratio_adjusted,
-        random_state= random_state,
-        stratify= train_val_df["Species"]
-    )
+    manifest = None
+    if use_manifest:
+        manifest = SplitManifest.load(manifest_path, boto3.client("s3"), bucket, key_column=hash_key_column)
+        manifest.runs += 1
+        print(f"Manifest holds {len(manifest)} rows, preparing run {manifest.runs}")
 
-    #printing split data sizes
-    print(f" Training Split: {len(train_df)} samples")
-    print(f" Validation Split: {len(val_df)} samples")
-    print(f" Test Split: {len(test_df)} samples")
-    print(f" Total Samples: { len(train_df) + len(val_df) + len(test_df)} samples")
+    # a delta only holds the new rows - too few to judge stratification on
+    is_delta = watermark > 0 or (manifest is not None and len(manifest) > 0)
 
+    # manifest and incremental runs always take the chunked path so only new rows are kept in memory.
+    # a delta can be a handful of rows, which train_test_split cannot stratify - the golden ratio
+    # placement can, and carries on from the class counts of the earlier runs
+    if streaming or manifest is not None or incremental:
+        print(f"Streaming {source_path} in chunks of {chunksize} rows")
+
+        if source == "sqlite":
+            chunks = iter_sqlite_chunks(sqlite_path, sqlite_table, batch_size=chunksize, after_id=watermark, up_to_id=max_id)
+        else:
+            chunks = pd.read_csv(input_file, chunksize=chunksize)
+
+        train_counts, val_counts, test_counts = stream_three_way_split(
+            chunks,
+            outputs,
+            train_ratio,
+            val_ratio,
+            random_state,
+            split_strategy=split_strategy,
+            hash_key_column=hash_key_column,
+            manifest=manifest,
+            class_counts=class_counts
+        )
+
+        if manifest is not None and sum(counts.sum() for counts in (train_counts, val_counts, test_counts)) == 0:
+            print("No rows missing from the manifest, nothing to upload")
+            return
+
+        if split_strategy == "hash" and not is_delta:
+            check_stratification([train_counts, val_counts, test_counts], [train_ratio, val_ratio, test_ratio], stratify_tolerance)
+
+        print(f"Files saved at {output_dir}")
+
+        # Verify class distributions in splits
+        print(f"Training set: {train_counts.sum()} samples: ")
+        print(train_counts)
+
+        print(f"Validation set: {val_counts.sum()} samples: ")
+        print(val_counts)
+
+        print(f"Test set: {test_counts.sum()} samples: ")
+        print(test_counts)
+
+    else:
+        #loading data
+        if source == "sqlite":
+            df = pd.concat(iter_sqlite_chunks(sqlite_path, sqlite_table, after_id=watermark, up_to_id=max_id), ignore_index=True)
+        else:
+            df = pd.read_csv(input_file)
+
+        print(f"Total Samples: {len(df)}")
+        print(f"Total Columns: {len(df.columns)}")
+
+        # Checking for Species
+        if LABEL_COLUMN not in df.columns:
+            raise ValueError(f"'{LABEL_COLUMN}' Column not found")
+
+        #print class distribution
+        print(f" Original Class Distribution:  {df[LABEL_COLUMN].value_counts().sort_index()}")
+
+        if split_strategy == "hash":
+            assignment = assign_by_hash(df, train_ratio, val_ratio, key_column=hash_key_column)
+
+        df = encode_chunk(df)
+
+        print("Label distribution:")
+        print(df[LABEL_COLUMN].value_counts().sort_index())
+
+        if split_strategy == "hash":
+            train_df, val_df, test_df = (df[assignment == split_idx] for split_idx in range(3))
+
+            if not is_delta:
+                check_stratification(
+                    [split_df[LABEL_COLUMN].value_counts() for split_df in (train_df, val_df, test_df)],
+                    [train_ratio, val_ratio, test_ratio],
+                    stratify_tolerance
+                )
+        else:
+            # Splitting Dataset - Separating Test Set - MUST BE UNSEEN
+            train_val_df, test_df = train_test_split(
+                df,
+                test_size= test_ratio,
+                random_state= random_state,
+                stratify=df[LABEL_COLUMN]
+            )
+
+            val_ratio_adjusted = val_ratio / (train_ratio + val_ratio)
+
+            # Splitting train_val_df into Train and Validation sets
+            train_df, val_df = train_test_split(
+                train_val_df,
+                test_size= val_ratio_adjusted,
+                random_state= random_state,
+                stratify= train_val_df[LABEL_COLUMN]
+            )
+
+        #printing split data sizes
+        print(f" Training Split: {len(train_df)} samples")
+        print(f" Validation Split: {len(val_df)} samples")
+        print(f" Test Split: {len(test_df)} samples")
+        print(f" Total Samples: { len(train_df) + len(val_df) + len(test_df)} samples")
 
-    # saving datasets
-    train_path = os.path.join(output_dir, "iris_train.csv")
-    val_path = os.path.join(output_dir, "iris_validation.csv")
-    test_path = os.path.join(output_dir, "iris_test.csv")
 
+        for split_df, output in zip((train_df, val_df, test_df), outputs):
+            output.write(split_df)
+            output.close()
 
-    # saving without header as per container expectations
-    train_df.to_csv(train_path, index = False, header = False)
-    val_df.to_csv(val_path, index = False, header = False)
-    test_df.to_csv(test_path, index = False, header = False)
+        train_counts, val_counts, test_counts = (
+            split_df[LABEL_COLUMN].value_counts().sort_index() for split_df in (train_df, val_df, test_df)
+        )
+
+        print(f"Files saved at {output_dir}")
+
+        # Verify class distributions in splits
+        print(f"Training set: {len(train_df)} samples: ")
+        print(train_counts)
+
+        print(f"Validation set: {len(val_df)} samples: ")
+        print(val_counts)
+
+        print(f"Test set: {len(test_df)} samples: ")
+        print(test_counts)
 
-    print(f"Files saved at {output_dir}")
     print(f" Training Dataset at {train_path}")
     print(f" Validation Dataset at {val_path}")
     print(f" Test Dataset at {test_path}")
 
-    # Verify class distributions in splits
-    print(f"Training set: {len(train_df)} samples: ")
-    print(train_df['Species'].value_counts().sort_index())
 
-    print(f"Validation set: {len(val_df)} samples: ")
-    print(val_df['Species'].value_counts().sort_index())
+    # Uploading files to S3
+    # incremental and manifest runs add objects next to the earlier ones instead of replacing them
+    if manifest is not None:
+        prefix = f"run-{manifest.runs:05d}-"
+    elif incremental:
+        prefix = f"ids-{watermark + 1}-{max_id}-"
+    else:
+        prefix = ""
+
+    uploads = {}
+    digests = {}
+    for split, output in zip(SPLIT_NAMES, outputs):
+        for path, rows in output.rows_per_path().items():
+            if manifest is not None:
+                # delta shards with no new rows are not worth an object
+                if rows == 0:
+                    continue
+                name = os.path.basename(path) if num_shards > 1 else f"part-00000.{output_format}"
+                key = f"data/{split}/{prefix}{name}"
+                digests[path] = file_sha256(path)
+                manifest.record_object(key, digests[path], rows)
+            else:
+                name = os.path.basename(path) if num_shards > 1 else f"iris.{output_format}"
+                key = f"data/{split}/{prefix}{name}"
+            uploads[path] = key
 
-    print(f"Test set: {len(test_df)} samples: ")
-    print(test_df['Species'].value_counts().sort_index())
+    # binary DMatrix buffers for the training channels, named after the digest of the split files
+    if dmatrix_cache:
+        # imports xgboost, which the other runs do not need
+        from dmatrix_cache import write_cache
 
+        for split, output in zip(SPLIT_NAMES[:2], outputs[:2]):
+            split_digests = {path: digests.get(path) or file_sha256(path) for path in output.paths}
+            digests.update(split_digests)
 
-    # Uploading files to S3
-    s3 = boto3.client("s3")
-    bucket = os.environ.get("S3_BUCKET", "terraform-sagemaker-firstbucket")
+            cache_dir = os.path.join(output_dir, f"{split}_dmatrix")
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = write_cache(output.paths, cache_dir, list(split_digests.values()))
+
+            uploads[cache_path] = f"data/{split}/{os.path.basename(cache_path)}"
+            print(f" DMatrix cache for {split} at {cache_path}")
 
-    s3.upload_file(train_path, bucket, "data/train/iris.csv")
-    s3.upload_file(val_path, bucket, "data/validation/iris.csv")
-    s3.upload_file(test_path, bucket, "data/test/iris.csv")
+    uploaded = upload_splits(
+        uploads,
+        bucket,
+        multipart_chunksize_mb=multipart_chunksize_mb,
+        max_concurrency=max_concurrency,
+        digests=digests
+    )
+
+    print(f"Uploaded {sum(uploaded.values())} of {len(uploaded)} files to S3.")
+
+    # manifest is only written once the delta is safely in S3
+    if manifest is not None:
+        manifest.save(manifest_path)
+        upload_splits({manifest_path: MANIFEST_S3_KEY}, bucket)
+        print(f"Manifest now holds {len(manifest)} rows in {len(manifest.objects)} objects")
+
+    # a full run - or the first incremental / manifest run, which holds every row too - replaces the
+    # channels, so whatever an earlier run left there (iris.csv, other shards, older deltas) goes.
+    # only done once the new objects are safely in S3
+    if not is_delta:
+        prefixes = [f"data/{split}/" for split in SPLIT_NAMES]
+        keep = set(uploads.values())
+        if manifest is not None:
+            keep.add(MANIFEST_S3_KEY)
+        else:
+            # the manifest would describe objects that are gone now
+            prefixes.append(MANIFEST_S3_KEY)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+        stale = delete_stale_objects(bucket, keep, prefixes)
+        print(f"Deleted {len(stale)} stale objects from S3.")
 
-    print("Uploaded files to S3.")
+        # so do the watermarks - the next incremental run would upload rows this run already split again
+        if os.path.exists(watermark_path):
+            os.remove(watermark_path)
+
+        # the channels now hold every row of this run, the random strategy carries on counting from them
+        totals = train_counts.add(val_counts, fill_value=0).add(test_counts, fill_value=0)
+        class_counts = {int(label): int(count) for label, count in totals.items()}
+
+    # only moved forward once the delta is safely in S3. a full sqlite run holds every row up to max_id,
+    # so incremental runs can carry on from it
+    if source == "sqlite" and manifest is None:
+        save_watermark(watermark_path, sqlite_table, max_id, class_counts)
+        print(f"Watermark for {sqlite_table} moved to Id {max_id}")
 
 if __name__ == "__main__":
-    prepare_three_way_split()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streaming", action="store_true", help="read the input in chunks instead of loading it at once")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--split-strategy", type=str, default="random", choices=SPLIT_STRATEGIES)
+    parser.add_argument("--hash-key", type=str, default="Id", help="column to hash, 'none' hashes the row content")
+    parser.add_argument("--stratify-tolerance", type=float, default=DEFAULT_STRATIFY_TOLERANCE)
+    parser.add_argument("--output-format", type=str, default="csv", choices=OUTPUT_FORMATS)
+    parser.add_argument("--source", type=str, default="csv", choices=SOURCES)
+    parser.add_argument("--sqlite-table", type=str, default=DEFAULT_SQLITE_TABLE)
+    parser.add_argument("--incremental", action="store_true", help="sqlite only - process rows added since the last run")
+    parser.add_argument("--manifest", action="store_true", help="only split rows missing from split_data/manifest.json")
+    parser.add_argument("--dmatrix-cache", action="store_true", help="also upload binary DMatrix buffers for train/validation")
+    parser.add_argument("--num-shards", type=int, default=DEFAULT_NUM_SHARDS, help="part-NNNNN files per split")
+    parser.add_argument("--multipart-chunksize-mb", type=int, default=DEFAULT_MULTIPART_CHUNKSIZE_MB)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+
+    args = parser.parse_args()
+
+    prepare_three_way_split(
+        streaming=args.streaming,
+        chunksize=args.chunksize,
+        split_strategy=args.split_strategy,
+        hash_key_column=None if args.hash_key.lower() == "none" else args.hash_key,
+        stratify_tolerance=args.stratify_tolerance,
+        multipart_chunksize_mb=args.multipart_chunksize_mb,
+        max_concurrency=args.max_concurrency,
+        output_format=args.output_format,
+        num_shards=args.num_shards,
+        source=args.source,
+        sqlite_table=args.sqlite_table,
+        incremental=args.incremental,
+        use_manifest=args.manifest,
+        dmatrix_cache=args.dmatrix_cache
+    )
@@ -0,0 +1,21 @@
+# Hyperparameter search space - shared by the SageMaker tuner (pipeline_terraform.py) and the local engine (hpo.py)
+
+# name -> (type, min, max), bounds inclusive
+SEARCH_SPACE = {
+    "max_depth" : ("int", 3, 10),
+    "eta" : ("float", 0.01, 0.3),
+    "num_round" : ("int", 30, 150)
+}
+
+# the local engine spends boosting rounds as its budget instead of sampling them
+FIDELITY = "num_round"
+
+
+def sample(rng):
+    """One random configuration of the non-fidelity hyperparameters."""
+    config = {}
+    for name, (kind, low, high) in SEARCH_SPACE.items():
+        if name == FIDELITY:
+            continue
+        config[name] = int(rng.integers(low, high + 1)) if kind == "int" else float(rng.uniform(low, high))
+    return config
@@ -0,0 +1,50 @@
+# Shared fixtures - the Iris data as split files, and train.py run in this process
+#
+#   python3 -m pytest ml/tests
+
+import os
+import runpy
+import sys
+import pandas as pd
+import pytest
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAINING_DIR = os.path.join(ML_DIR, "training")
+BENCHMARKS_DIR = os.path.join(ML_DIR, "benchmarks")
+RAW_DATA = os.path.join(os.path.dirname(ML_DIR), "data", "raw", "Iris.csv")
+
+# the scripts import their neighbours by bare name, as they do inside the containers
+sys.path[:0] = [ML_DIR, TRAINING_DIR]
+# last, so its scripts never shadow the training modules of the same name - tests only import _common from it
+sys.path.append(BENCHMARKS_DIR)
+
+
+@pytest.fixture(scope="session")
+def iris():
+    """data/raw/Iris.csv in the split layout - int8 label first, float32 features."""
+    from schema import encode_chunk
+    return encode_chunk(pd.read_csv(RAW_DATA))
+
+
+@pytest.fixture
+def channels(tmp_path, iris):
+    """train and validation channel directories holding alternate Iris rows as headerless CSV."""
+    dirs = {}
+    for name, rows in (("train", iris.iloc[::2]), ("validation", iris.iloc[1::2])):
+        dirs[name] = tmp_path / name
+        dirs[name].mkdir()
+        rows.to_csv(dirs[name] / "iris.csv", index=False, header=False)
+    return dirs
+
+
+@pytest.fixture
+def run_train(monkeypatch):
+    """Runs train.py as __main__ with the given arguments."""
+    for name in ("SM_CHANNEL_VALIDATION", "SM_CHANNEL_MODEL"):
+        monkeypatch.delenv(name, raising=False)
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["train.py", *map(str, args)])
+        runpy.run_path(os.path.join(TRAINING_DIR, "train.py"), run_name="__main__")
+
+    return run
@@ -0,0 +1,80 @@
+# Model archives - only the model file is read, and members that could land outside the archive are refused
+
+import io
+import os
+import tarfile
+import pytest
+
+import artifacts
+from artifacts import extract_model, read_model_bytes
+
+MODEL = b"model bytes"
+MODEL_NAMES = set(artifacts.MODEL_FILES.values())
+
+
+def add_file(tar, name, data=MODEL):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_archive(path, *members):
+    """model.tar.gz at path, members written in order - (name, bytes) or a prepared TarInfo."""
+    with tarfile.open(path, "w:gz") as tar:
+        for member in members:
+            if isinstance(member, tarfile.TarInfo):
+                tar.addfile(member)
+            else:
+                add_file(tar, *member)
+    return str(path)
+
+
+def symlink(name, target):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    return info
+
+
+def test_reads_only_the_model(tmp_path):
+    path = write_archive(tmp_path / "model.tar.gz", ("./code/inference.py", b"print()"), ("./model.ubj", MODEL))
+    assert read_model_bytes(path) == ("model.ubj", MODEL)
+
+
+@pytest.mark.parametrize("member", [
+    ("../model.bst", MODEL),
+    ("code/../../model.bst", MODEL),
+    ("/tmp/model.bst", MODEL),
+    symlink("model.bst", "/etc/passwd"),
+    symlink("code", "/etc"),
+], ids=["traversal", "nested-traversal", "absolute", "symlink-model", "symlink-dir"])
+def test_unsafe_members_are_refused(tmp_path, member):
+    path = write_archive(tmp_path / "model.tar.gz", member, ("model.bst", MODEL))
+
+    with pytest.raises(ValueError):
+        read_model_bytes(path)
+    with pytest.raises(ValueError):
+        extract_model(path, str(tmp_path / "cache"))
+    # nothing was written next to or outside the cache
+    assert not (tmp_path / "model.bst").exists()
+    assert not any(name in MODEL_NAMES for _, _, names in os.walk(tmp_path / "cache") for name in names)
+
+
+def test_extract_is_cached_by_archive_digest(tmp_path, monkeypatch):
+    path = write_archive(tmp_path / "model.tar.gz", ("model.json", MODEL))
+    cache_dir = str(tmp_path / "cache")
+
+    model_dir = extract_model(path, cache_dir)
+    with open(os.path.join(model_dir, "model.json"), "rb") as f:
+        assert f.read() == MODEL
+
+    # the same bytes again are served from the cache without opening the archive
+    def no_open(*args, **kwargs):
+        raise AssertionError("archive decompressed again")
+    monkeypatch.setattr(artifacts.tarfile, "open", no_open)
+    assert extract_model(path, cache_dir) == model_dir
+
+    # other bytes get their own directory
+    monkeypatch.undo()
+    other = write_archive(tmp_path / "other.tar.gz", ("model.json", b"other model"))
+    assert extract_model(other, cache_dir) != model_dir
@@ -0,0 +1,117 @@
+# Checkpoint/resume - a job killed and restarted twice ends with the rounds it was asked for
+
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from callbacks import CheckpointCallback, checkpoint_key, list_checkpoints, load_latest_checkpoint
+
+PARAMS = {"objective": "multi:softprob", "num_class": 3, "max_depth": 3, "eta": 0.1, "tree_method": "hist"}
+NUM_ROUND = 50
+
+
+class Reclaimed(Exception):
+    pass
+
+
+class KillAfter(xgb.callback.TrainingCallback):
+    """Stands in for a spot reclaim - stops the job dead once the booster holds `rounds` rounds."""
+
+    def __init__(self, rounds):
+        self._rounds = rounds
+        super().__init__()
+
+    def after_iteration(self, model, epoch, evals_log):
+        if model.num_boosted_rounds() >= self._rounds:
+            raise Reclaimed()
+        return False
+
+
+def run_job(dtrain, checkpoint_dir, kill_after=None, params=PARAMS):
+    """One attempt of the job as train.py runs it - resume from the newest checkpoint, boost what is left."""
+    key = checkpoint_key(params, dtrain.num_row())
+    resume_model = load_latest_checkpoint(checkpoint_dir, key)
+    start_round = resume_model.num_boosted_rounds() if resume_model is not None else 0
+
+    callbacks = [CheckpointCallback(checkpoint_dir, interval=10, key=key)]
+    if kill_after is not None:
+        callbacks.append(KillAfter(kill_after))
+
+    try:
+        model = xgb.train(params, dtrain, NUM_ROUND - start_round, xgb_model=resume_model, callbacks=callbacks)
+    except Reclaimed:
+        model = None
+    return start_round, model
+
+
+@pytest.fixture
+def dtrain(iris):
+    return xgb.DMatrix(iris.drop("Species", axis=1), label=iris["Species"])
+
+
+def test_resume_twice_only_moves_forward(tmp_path, dtrain):
+    key = checkpoint_key(PARAMS, dtrain.num_row())
+    resumed = []
+    for kill_after in (25, 37, None):
+        start_round, model = run_job(dtrain, str(tmp_path), kill_after)
+        resumed.append(start_round)
+
+        # every checkpoint is named after the rounds it holds
+        for rounds, path in list_checkpoints(str(tmp_path), key):
+            assert xgb.Booster(model_file=path).num_boosted_rounds() == rounds
+
+    assert resumed == [0, 20, 30]
+    assert model.num_boosted_rounds() == NUM_ROUND
+    assert [rounds for rounds, _ in list_checkpoints(str(tmp_path), key)] == [30, 40, 50]
+    assert model.attr("checkpoint_key") is None
+
+
+def test_interleaved_runs_resume_their_own_checkpoints(tmp_path, dtrain):
+    # two tuning trials of one execution share the checkpoint directory and are reclaimed in turn
+    other_params = {**PARAMS, "eta": 0.3}
+    assert run_job(dtrain, str(tmp_path), kill_after=35)[0] == 0
+    assert run_job(dtrain, str(tmp_path), kill_after=45, params=other_params)[0] == 0
+
+    start_round, model = run_job(dtrain, str(tmp_path))
+    assert start_round == 30
+    assert model.num_boosted_rounds() == NUM_ROUND
+
+    start_round, model = run_job(dtrain, str(tmp_path), params=other_params)
+    assert start_round == 40
+    assert model.num_boosted_rounds() == NUM_ROUND
+
+    # neither pruned the other's
+    for params in (PARAMS, other_params):
+        key = checkpoint_key(params, dtrain.num_row())
+        assert [rounds for rounds, _ in list_checkpoints(str(tmp_path), key)] == [30, 40, 50]
+
+
+def test_checkpoint_with_another_key_is_ignored(tmp_path, dtrain):
+    run_job(dtrain, str(tmp_path), kill_after=25)
+
+    # checkpoints carrying another run's key under this run's names - a digest collision
+    key = checkpoint_key(PARAMS, dtrain.num_row())
+    for _, path in list_checkpoints(str(tmp_path), key):
+        booster = xgb.Booster(model_file=path)
+        booster.set_attr(checkpoint_key="another run")
+        booster.save_model(path)
+
+    assert load_latest_checkpoint(str(tmp_path), key) is None
+
+
+def test_train_py_resumes_only_its_own_checkpoints(tmp_path, channels, run_train, capsys):
+    args = [
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"],
+        "--checkpoint_dir", tmp_path / "checkpoints", "--checkpoint_interval", 10, "--num_round", 30,
+    ]
+
+    run_train(*args, "--model-dir", tmp_path / "model-1")
+    assert "Already trained" not in capsys.readouterr().out
+
+    # a restart with the same arguments finds the finished run's last checkpoint
+    run_train(*args, "--model-dir", tmp_path / "model-2")
+    assert "Already trained: 30 - 0 rounds left" in capsys.readouterr().out
+
+    # a different run in the same directory starts over
+    run_train(*args, "--model-dir", tmp_path / "model-3", "--eta", 0.3)
+    assert "Already trained" not in capsys.readouterr().out
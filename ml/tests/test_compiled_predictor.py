@@ -0,0 +1,68 @@
+# Compiled predictor parity - the C build of the model train.py saves, against Booster.predict
+
+import os
+import shutil
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+if shutil.which(os.environ.get("CC", "cc")) is None:
+    pytest.skip("no C compiler to build the trees with", allow_module_level=True)
+
+import inference
+from compiled_predictor import make_predictor
+from model_io import load_model
+from schema import FEATURE_COLUMNS, LABEL_COLUMN
+
+# the leaf values are float32 and the compiled code adds them up in tree order, xgboost in its own
+TOLERANCE = 1e-5
+
+
+@pytest.fixture
+def model_dir(tmp_path, channels, run_train):
+    model_dir = tmp_path / "model"
+    run_train(
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"], "--model-dir", model_dir,
+        "--num_round", 50, "--max_depth", 4
+    )
+    return str(model_dir)
+
+
+@pytest.fixture
+def features(iris):
+    # every Iris row, plus a copy with missing values so the default directions are taken too
+    X = iris.drop(LABEL_COLUMN, axis=1).to_numpy()
+    X_missing = X.copy()
+    X_missing[np.random.default_rng(0).random(X.shape) < 0.2] = np.nan
+    return np.vstack([X, X_missing])
+
+
+def test_compiled_predictor_matches_booster(tmp_path, model_dir, features):
+    booster = load_model(model_dir)
+    expected = booster.predict(xgb.DMatrix(features, feature_names=FEATURE_COLUMNS))
+
+    predictor = make_predictor(booster, "compiled", build_dir=str(tmp_path / "build"))
+    assert predictor.kind == "compiled"
+    actual = predictor.predict(features)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE)
+    assert (actual.argmax(axis=1) == expected.argmax(axis=1)).all()
+
+
+def test_inference_serves_through_the_compiled_predictor(monkeypatch, model_dir, features):
+    monkeypatch.setattr(inference, "PREDICTOR_KIND", "compiled")
+    model = inference.model_fn(model_dir)
+    assert model.kind == "compiled"
+
+    rows = features[:150]
+    body = "\n".join(",".join(f"{value:.9g}" for value in row) for row in rows)
+    prediction, content_type = inference.output_fn(
+        inference.predict_fn(inference.input_fn(body, "text/csv"), model), "text/csv"
+    )
+
+    expected = load_model(model_dir).predict(xgb.DMatrix(rows, feature_names=FEATURE_COLUMNS))
+    actual = np.loadtxt(prediction.splitlines(), delimiter=",", ndmin=2)
+    assert content_type == "text/csv"
+    # output_fn writes 8 significant digits
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE)
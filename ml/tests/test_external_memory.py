@@ -0,0 +1,46 @@
+# Memory ceiling - building the training matrix with external memory must not hold the features in RAM.
+# Measured as the growth between two data sizes, so the fixed cost of the xgboost runtime drops out
+
+import os
+import runpy
+import pytest
+
+pytest.importorskip("xgboost")
+
+from _common import write_shards
+from conftest import BENCHMARKS_DIR
+
+BENCHMARK = os.path.join(BENCHMARKS_DIR, "external_memory.py")
+
+SMALL_ROWS, LARGE_ROWS = 500_000, 3_000_000
+BATCH_ROWS = 50_000
+
+# four float32 features - what every extra row costs in RAM when the matrix holds the data
+FEATURE_BYTES_PER_ROW = 4 * 4
+# external memory only keeps the float32 label of every row, the quantised features are paged to disk.
+# the ceiling is half the feature bytes, the rest is headroom for RSS noise
+EXTERNAL_CEILING_BYTES_PER_ROW = FEATURE_BYTES_PER_ROW / 2
+
+
+def test_external_memory_does_not_hold_the_features(tmp_path):
+    # the benchmark's measure() builds the matrix in a fresh process per mode and size
+    benchmark = runpy.run_path(BENCHMARK)
+
+    builds = {}
+    for rows in (SMALL_ROWS, LARGE_ROWS):
+        workdir = tmp_path / str(rows)
+        write_shards(str(workdir / "train"), rows, 8)
+        builds[rows] = {
+            mode: benchmark["measure"](mode, str(workdir), BATCH_ROWS, 0, stage="dmatrix")
+            for mode in benchmark["MODES"]
+        }
+
+    extra_rows = LARGE_ROWS - SMALL_ROWS
+    bytes_per_row = {
+        mode: (builds[LARGE_ROWS][mode] - builds[SMALL_ROWS][mode]) * 1024 ** 2 / extra_rows
+        for mode in benchmark["MODES"]
+    }
+
+    # the in-memory build holds at least the features, or the measurement cannot tell the modes apart
+    assert bytes_per_row["in_memory"] > FEATURE_BYTES_PER_ROW, (builds, bytes_per_row)
+    assert bytes_per_row["external"] < EXTERNAL_CEILING_BYTES_PER_ROW, (builds, bytes_per_row)
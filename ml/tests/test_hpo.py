@@ -0,0 +1,88 @@
+# Hyperband schedule - brackets, promotion of the best 1/eta and the rounds of every rung, with a stub objective
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+pytest.importorskip("xgboost")
+
+import hpo
+from search_space import FIDELITY
+
+# the worked example of the Hyperband paper - 81 rounds at most, eta 3
+PAPER_BRACKETS = [
+    [(81, 1), (27, 3), (9, 9), (3, 27), (1, 81)],
+    [(34, 3), (11, 9), (3, 27), (1, 81)],
+    [(15, 9), (5, 27), (1, 81)],
+    [(8, 27), (2, 81)],
+    [(5, 81)],
+]
+
+
+def test_brackets_follow_the_hyperband_schedule():
+    assert list(hpo.brackets(81, 1, 3, "hyperband")) == PAPER_BRACKETS
+    assert list(hpo.brackets(81, 1, 3, "successive_halving")) == PAPER_BRACKETS[:1]
+
+
+def stub_loss(config, rounds):
+    """Lower eta is better at every round, and every curve bottoms out at round 60."""
+    return config["eta"] + (rounds - 60) ** 2 / 1e4
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Every run_trial call as (config, rounds, rounds already boosted), in submission order."""
+    calls = []
+
+    def run_trial(config, rounds, model_raw=None):
+        done = model_raw or 0
+        calls.append((config, rounds, done))
+        # the "model" is the number of rounds it holds
+        return [stub_loss(config, r) for r in range(done + 1, rounds + 1)], rounds
+
+    # one thread, so trials run in the order they were submitted, without loading any data
+    monkeypatch.setattr(hpo, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(hpo, "init_worker", lambda *args: None)
+    monkeypatch.setattr(hpo, "run_trial", run_trial)
+    return calls
+
+
+def test_search_promotes_the_best_trials_of_every_rung(tmp_path, calls):
+    best, trial_count, rounds_spent = hpo.search("train", "validation", max_rounds=81, reduction_factor=3, workers=1)
+
+    schedule = list(hpo.brackets(81, 9, 3, "hyperband"))
+    assert schedule == [[(9, 9), (3, 27), (1, 81)], [(5, 27), (1, 81)], [(3, 81)]]
+    assert trial_count == sum(rungs[0][0] for rungs in schedule)
+    assert rounds_spent == sum(rounds - done for _, rounds, done in calls)
+
+    remaining = iter(calls)
+    finalists = []
+    for rungs in schedule:
+        previous_rounds, previous_configs = 0, None
+        for n_trials, rounds in rungs:
+            rung = [next(remaining) for _ in range(n_trials)]
+
+            # every trial gets the rung's rounds, continuing from the model of the previous rung
+            assert all(call_rounds == rounds and done == previous_rounds for _, call_rounds, done in rung)
+
+            # promoted are the 1/eta best of the previous rung
+            configs = [config for config, _, _ in rung]
+            if previous_configs is not None:
+                ranked = sorted(previous_configs, key=lambda config: stub_loss(config, previous_rounds))
+                assert sorted(config["eta"] for config in configs) == [config["eta"] for config in ranked[:n_trials]]
+
+            previous_rounds, previous_configs = rounds, configs
+        finalists.extend(previous_configs)
+    assert next(remaining, None) is None
+
+    assert best.config == min(finalists, key=lambda config: config["eta"])
+
+    path = tmp_path / hpo.BEST_HYPERPARAMETERS_FILE
+    written = hpo.save_best(best, str(path), "hyperband", trial_count, rounds_spent, 1.0)
+    with open(path) as f:
+        assert json.load(f) == written
+
+    # num_round is the round the validation curve bottomed out at
+    assert written["hyperparameters"] == {**best.config, FIDELITY: 60}
+    assert written["validation:mlogloss"] == pytest.approx(best.config["eta"])
+    assert (written["trials"], written["boosting_rounds"]) == (trial_count, rounds_spent)
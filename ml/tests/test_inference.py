@@ -0,0 +1,39 @@
+# Request parsing of the inference entry point - every accepted payload is rows of the four features
+
+import numpy as np
+import pytest
+
+pytest.importorskip("xgboost")
+
+from inference import input_fn
+
+ROW = [5.1, 3.5, 1.4, 0.2]
+
+
+@pytest.mark.parametrize("body, content_type, rows", [
+    ("5.1,3.5,1.4,0.2", "text/csv", 1),
+    ("5.1,3.5,1.4,0.2\n6.2,2.9,4.3,1.3\n", "text/csv", 2),
+    ("[5.1, 3.5, 1.4, 0.2]", "application/json", 1),
+    ("[[5.1, 3.5, 1.4, 0.2], [6.2, 2.9, 4.3, 1.3]]", "application/json", 2),
+    ('{"instances": [5.1, 3.5, 1.4, 0.2]}', "application/json", 1),
+    (b'{"instances": [[5.1, 3.5, 1.4, 0.2]]}', "application/json", 1),
+])
+def test_input_fn_reads_rows_of_features(body, content_type, rows):
+    parsed = input_fn(body, content_type)
+    assert parsed.shape == (rows, 4)
+    np.testing.assert_allclose(parsed[0], ROW, rtol=1e-6)
+
+
+@pytest.mark.parametrize("body, content_type", [
+    ("5.1,3.5,1.4", "text/csv"),
+    ("[5.1, 3.5, 1.4]", "application/json"),
+    ("[[5.1, 3.5, 1.4, 0.2], [6.2, 2.9]]", "application/json"),
+    ("[]", "application/json"),
+    ('{"rows": [5.1, 3.5, 1.4, 0.2]}', "application/json"),
+    ("not json", "application/json"),
+    ("5.1,3.5,1.4,0.2", "application/x-parquet"),
+])
+def test_input_fn_rejects_other_shapes(body, content_type):
+    # serve.py answers a ValueError with 400 instead of a 500
+    with pytest.raises(ValueError):
+        input_fn(body, content_type)
@@ -0,0 +1,88 @@
+# Metric accumulators and bootstrap intervals against their definitions
+
+import json
+import numpy as np
+import pytest
+
+from metrics import MetricAccumulator, bootstrap_intervals
+from schema import LABEL_VOCABULARY
+
+
+def test_bootstrap_matches_resampling_rows():
+    confusion = np.array([[40, 3, 1], [2, 35, 6], [0, 5, 38]])
+    y_true, y_pred = np.divmod(np.repeat(np.arange(9), confusion.ravel()), 3)
+    n = len(y_true)
+
+    # the textbook bootstrap - draw n rows, count them
+    rng = np.random.default_rng(1)
+    accuracy = [np.mean(y_true[rows] == y_pred[rows]) for rows in rng.integers(0, n, size=(4000, n))]
+    expected = np.quantile(accuracy, [0.025, 0.975])
+
+    interval = bootstrap_intervals(confusion, LABEL_VOCABULARY, 4000, seed=2)["accuracy"]
+    # the two differ only by Monte Carlo error, well under one row of 130
+    np.testing.assert_allclose([interval["lower"], interval["upper"]], expected, atol=1 / n)
+
+
+def test_bootstrap_cost_does_not_grow_with_rows():
+    # 10 million rows would take minutes to resample row by row
+    confusion = np.array([[3_000_000, 100_000, 0], [50_000, 3_000_000, 200_000], [0, 150_000, 3_500_000]])
+    intervals = bootstrap_intervals(confusion, LABEL_VOCABULARY, 10_000)
+    assert intervals["accuracy"]["lower"] < confusion.trace() / confusion.sum() < intervals["accuracy"]["upper"]
+
+
+def test_bootstrap_class_missing_from_test_data_is_null():
+    confusion = np.array([[10, 0, 0], [1, 9, 0], [0, 0, 0]])
+    intervals = bootstrap_intervals(confusion, LABEL_VOCABULARY, 1000)
+
+    assert intervals["recall"]["Iris-virginica"] == {"lower": None, "upper": None}
+    # JsonGet has to be able to parse evaluation.json
+    json.loads(json.dumps(intervals, allow_nan=False))
+
+
+def test_evaluation_agrees_with_classification_report():
+    sklearn_metrics = pytest.importorskip("sklearn.metrics")
+    rng = np.random.default_rng(0)
+
+    for _ in range(200):
+        rows = rng.integers(5, 60)
+        y_true, probabilities = rng.integers(0, 3, rows), rng.random((rows, 3))
+
+        accumulator = MetricAccumulator(3)
+        accumulator.update(y_true, probabilities)
+        evaluation = accumulator.evaluation(LABEL_VOCABULARY)
+
+        report = sklearn_metrics.classification_report(
+            y_true, probabilities.argmax(axis=1), labels=[0, 1, 2], target_names=LABEL_VOCABULARY,
+            output_dict=True, zero_division=0
+        )
+        # sklearn releases round F1 differently, so equal up to the last digits rather than bit for bit
+        assert evaluation["accuracy"] == pytest.approx(report["accuracy"], rel=1e-12)
+        for name in LABEL_VOCABULARY:
+            for key in ("precision", "recall", "f1-score"):
+                assert evaluation["per_class_metrics"][name][key] == pytest.approx(report[name][key], rel=1e-12)
+            assert evaluation["per_class_metrics"][name]["support"] == report[name]["support"]
+        for key in ("precision", "recall", "f1-score"):
+            assert evaluation["macro_avg"][key] == pytest.approx(report["macro avg"][key], rel=1e-12)
+
+
+def test_merged_shards_match_one_accumulator_over_every_row():
+    rng = np.random.default_rng(1)
+    y_true, probabilities = rng.integers(0, 3, 1000), rng.dirichlet(np.ones(3), 1000)
+
+    single = MetricAccumulator(3)
+    single.update(y_true, probabilities)
+
+    # uneven shards, each read in batches, merged in an order other than the rows'
+    shards = []
+    for rows in np.split(np.arange(1000), [130, 131, 600]):
+        shard = MetricAccumulator(3)
+        for batch in np.array_split(rows, 3):
+            shard.update(y_true[batch], probabilities[batch])
+        shards.append(shard)
+    merged = MetricAccumulator(3)
+    for shard in reversed(shards):
+        merged.merge(shard)
+
+    expected, actual = single.evaluation(LABEL_VOCABULARY), merged.evaluation(LABEL_VOCABULARY)
+    assert actual.pop("logloss") == pytest.approx(expected.pop("logloss"), rel=1e-12)
+    assert actual == expected
@@ -0,0 +1,34 @@
+# NumPy predictor parity - the model.json train.py saves, scored without xgboost, against Booster.predict
+
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from numpy_predictor import NumpyPredictor
+from schema import FEATURE_COLUMNS, LABEL_COLUMN
+from tree_model import MODEL_JSON_FILE
+
+# the leaf values are float32 and xgboost adds them up in its own order
+TOLERANCE = 1e-5
+
+
+def test_numpy_predictor_matches_booster(tmp_path, channels, iris, run_train):
+    model_dir = tmp_path / "model"
+    run_train(
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"], "--model-dir", model_dir,
+        "--model_format", "json", "--num_round", 50, "--max_depth", 4
+    )
+    model_path = str(model_dir / MODEL_JSON_FILE)
+
+    # every Iris row, plus a copy with missing values so the default directions are taken too
+    X = iris.drop(LABEL_COLUMN, axis=1).to_numpy()
+    X_missing = X.copy()
+    X_missing[np.random.default_rng(0).random(X.shape) < 0.2] = np.nan
+    X = np.vstack([X, X_missing])
+
+    expected = xgb.Booster(model_file=model_path).predict(xgb.DMatrix(X, feature_names=FEATURE_COLUMNS))
+    actual = NumpyPredictor.from_json(model_path).predict(X)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE)
+    assert (actual.argmax(axis=1) == expected.argmax(axis=1)).all()
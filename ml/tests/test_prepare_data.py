@@ -0,0 +1,168 @@
+# prepare_data.py against a moto S3 bucket, run from a scratch copy of data/
+
+import os
+import shutil
+import sqlite3
+import pandas as pd
+import pytest
+
+pytest.importorskip("moto")
+
+import boto3
+from moto import mock_aws
+
+import prepare_data
+from conftest import RAW_DATA
+from schema import LABEL_COLUMN, load_channel
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Scratch directory laid out like the repo root - data/raw/iris.csv and data/database.sqlite."""
+    data_dir = tmp_path / "data"
+    (data_dir / "raw").mkdir(parents=True)
+    shutil.copy(RAW_DATA, data_dir / "raw" / "iris.csv")
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(RAW_DATA)), "database.sqlite"), data_dir)
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1"), ("S3_BUCKET", BUCKET)):
+        monkeypatch.setenv(name, value)
+
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def list_keys(s3, prefix):
+    return [obj["Key"] for obj in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get("Contents", [])]
+
+
+def read_channel(s3, split):
+    """Downloads data/<split>/ and loads it the way train.py and evaluate.py load a channel."""
+    channel_dir = os.path.join("channels", split)
+    os.makedirs(channel_dir)
+    for key in list_keys(s3, f"data/{split}/"):
+        s3.download_file(BUCKET, key, os.path.join(channel_dir, key.split("/")[-1]))
+    return load_channel(channel_dir)
+
+
+def test_small_sqlite_deltas_keep_the_split_ratios(workdir, s3):
+    conn = sqlite3.connect(workdir / "data" / "database.sqlite")
+    held_back = conn.execute("SELECT * FROM Iris WHERE Id > 60 ORDER BY Id").fetchall()
+    conn.execute("DELETE FROM Iris WHERE Id > 60")
+    conn.commit()
+
+    prepare_data.prepare_three_way_split(source="sqlite", incremental=True)
+
+    # the upstream system adds six rows a day - fewer than train_test_split can stratify
+    for start in range(0, len(held_back), 6):
+        conn.executemany("INSERT INTO Iris VALUES (?, ?, ?, ?, ?, ?)", held_back[start:start + 6])
+        conn.commit()
+        prepare_data.prepare_three_way_split(source="sqlite", incremental=True)
+    conn.close()
+
+    channels = {split: read_channel(s3, split) for split in prepare_data.SPLIT_NAMES}
+    sizes = {split: len(channel) for split, channel in channels.items()}
+    assert sum(sizes.values()) == 150
+    assert sizes == pytest.approx({"train": 90, "validation": 30, "test": 30}, abs=3)
+
+    # per class too - every class is 50 rows
+    test_labels = channels["test"][LABEL_COLUMN].value_counts()
+    assert test_labels.to_dict() == pytest.approx({0: 10, 1: 10, 2: 10}, abs=2)
+
+
+def test_incremental_run_after_a_full_run_only_adds_new_rows(workdir, s3):
+    conn = sqlite3.connect(workdir / "data" / "database.sqlite")
+    held_back = conn.execute("SELECT * FROM Iris WHERE Id > 140 ORDER BY Id").fetchall()
+    conn.execute("DELETE FROM Iris WHERE Id > 140")
+    conn.commit()
+
+    prepare_data.prepare_three_way_split(source="sqlite", incremental=True)
+    conn.executemany("INSERT INTO Iris VALUES (?, ?, ?, ?, ?, ?)", held_back[:5])
+    conn.commit()
+
+    # the full run takes Ids up to 145 - the watermark left at 140 must not survive it
+    prepare_data.prepare_three_way_split(source="sqlite")
+    prepare_data.prepare_three_way_split(source="sqlite", incremental=True)
+    assert sum(len(read_channel(s3, split)) for split in prepare_data.SPLIT_NAMES) == 145
+
+    conn.executemany("INSERT INTO Iris VALUES (?, ?, ?, ?, ?, ?)", held_back[5:])
+    conn.commit()
+    conn.close()
+    prepare_data.prepare_three_way_split(source="sqlite", incremental=True)
+
+    assert any("/ids-146-150-" in key for key in list_keys(s3, "data/"))
+    shutil.rmtree("channels")
+    assert sum(len(read_channel(s3, split)) for split in prepare_data.SPLIT_NAMES) == 150
+
+
+@pytest.mark.parametrize("rerun", [
+    {"num_shards": 2},
+    {"output_format": "parquet"},
+    {"source": "sqlite", "incremental": True},
+    {"use_manifest": True},
+])
+def test_full_run_replaces_the_channels(workdir, s3, rerun):
+    prepare_data.prepare_three_way_split()
+    prepare_data.prepare_three_way_split(**rerun)
+
+    # only the second run's objects are left, so every row is in exactly one split
+    channels = {split: read_channel(s3, split) for split in prepare_data.SPLIT_NAMES}
+    assert sum(len(channel) for channel in channels.values()) == 150
+    assert not any(key.endswith("/iris.csv") for key in list_keys(s3, "data/"))
+
+
+def test_check_stratification_rejects_drift_over_the_tolerance():
+    ratios = [0.6, 0.2, 0.2]
+    within = [pd.Series({0: 28, 1: 34}), pd.Series({0: 12, 1: 9}), pd.Series({0: 10, 1: 7})]
+    prepare_data.check_stratification(within, ratios, 0.10)
+
+    # class 1 gets 3 of 50 rows in test - 0.14 off the 0.2 ratio
+    outside = [pd.Series({0: 28, 1: 34}), pd.Series({0: 12, 1: 13}), pd.Series({0: 10, 1: 3})]
+    with pytest.raises(ValueError, match="outside the stratification tolerance"):
+        prepare_data.check_stratification(outside, ratios, 0.10)
+    prepare_data.check_stratification(outside, ratios, 0.15)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_hash_split_outside_the_tolerance_is_not_uploaded(workdir, s3, streaming):
+    # the Id hash of Iris puts 3 of the 50 versicolor rows in test
+    with pytest.raises(ValueError, match="outside the stratification tolerance"):
+        prepare_data.prepare_three_way_split(split_strategy="hash", streaming=streaming)
+    assert list_keys(s3, "data/") == []
+
+    prepare_data.prepare_three_way_split(split_strategy="hash", streaming=streaming, stratify_tolerance=0.15)
+    assert sum(len(read_channel(s3, split)) for split in prepare_data.SPLIT_NAMES) == 150
+
+
+def test_upload_skips_unchanged_objects(tmp_path, s3):
+    paths = {split: tmp_path / f"{split}.csv" for split in prepare_data.SPLIT_NAMES}
+    for split, path in paths.items():
+        path.write_text(f"0,{split}\n")
+    uploads = {str(path): f"data/{split}/iris.csv" for split, path in paths.items()}
+
+    # a 5 MB part size puts the bigger file through the multipart path
+    paths["train"].write_bytes(os.urandom(12 * 1024 * 1024))
+    assert all(prepare_data.upload_splits(uploads, BUCKET, multipart_chunksize_mb=5).values())
+
+    head = s3.head_object(Bucket=BUCKET, Key="data/train/iris.csv")
+    assert head["Metadata"][prepare_data.DIGEST_METADATA_KEY] == prepare_data.file_sha256(paths["train"])
+    assert head["ContentLength"] == 12 * 1024 * 1024
+    assert head["ETag"].endswith("-3\"")  # three parts
+
+    # nothing changed - nothing uploaded, so the EventBridge rule has nothing to fire on
+    assert not any(prepare_data.upload_splits(uploads, BUCKET).values())
+
+    paths["test"].write_text("1,changed\n")
+    uploaded = prepare_data.upload_splits(uploads, BUCKET)
+    assert uploaded == {"data/train/iris.csv": False, "data/validation/iris.csv": False, "data/test/iris.csv": True}
+    assert s3.get_object(Bucket=BUCKET, Key="data/test/iris.csv")["Body"].read() == b"1,changed\n"
@@ -0,0 +1,81 @@
+# train.py end to end on the Iris channels - cross-validation, early stopping, and the metrics it prints for the tuner
+
+import json
+import re
+import pytest
+
+pytest.importorskip("xgboost")
+
+from callbacks import PROFILE_DIR
+from model_io import load_model
+
+
+def printed_metric(output, name):
+    """Value of the last `name=value;` line train.py printed for the tuner's metric regexes, None without one."""
+    values = re.findall(rf"^{re.escape(name)}=([\d.]+);", output, re.MULTILINE)
+    return float(values[-1]) if values else None
+
+
+def test_cv_folds_trains_on_the_cross_validated_rounds(tmp_path, channels, run_train, capsys):
+    model_dir = tmp_path / "model"
+    run_train(
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"], "--model-dir", model_dir,
+        "--cv_folds", 3, "--early_stopping_rounds", 5, "--num_round", 200, "--eta", 0.3
+    )
+    output = capsys.readouterr().out
+
+    # train and validation are pooled - every Iris row is in the folds
+    assert "Cross-validation data shape: (150, 4)" in output
+
+    cv_rounds = printed_metric(output, "validation:cv_rounds")
+    assert 0 < cv_rounds < 200, "early stopping on the cross-validated mean never triggered"
+    assert printed_metric(output, "validation:mlogloss") is not None
+    assert printed_metric(output, "validation:mlogloss_std") is not None
+    # the single split's early stopping does not run next to it
+    assert printed_metric(output, "validation:best_iteration") is None
+
+    assert load_model(str(model_dir)).num_boosted_rounds() == cv_rounds
+
+
+def train_with_early_stopping(tmp_path, channels, run_train, capsys, name, *args):
+    """
+    Runs train.py with early stopping. Returns the saved model, the best_iteration it printed, and the
+    rounds it boosted in this run (from its profile) before it stopped.
+    """
+    model_dir = tmp_path / name
+    run_train(
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"], "--model-dir", model_dir,
+        "--early_stopping_rounds", 5, "--eta", 0.3, *args
+    )
+    best_iteration = printed_metric(capsys.readouterr().out, "validation:best_iteration")
+    with open(model_dir / PROFILE_DIR / "profile.json") as f:
+        boosted = json.load(f)["summary"]["rounds"]
+    return load_model(str(model_dir)), int(best_iteration), boosted
+
+
+def test_early_stopping_keeps_the_rounds_up_to_the_best(tmp_path, channels, run_train, capsys):
+    model, best_iteration, boosted = train_with_early_stopping(
+        tmp_path, channels, run_train, capsys, "model", "--num_round", 200
+    )
+
+    # stopped early, 5 rounds past the best, and the rounds after the best were dropped
+    assert boosted == best_iteration + 1 + 5 < 200
+    assert model.num_boosted_rounds() == best_iteration + 1
+
+
+def test_early_stopping_keeps_the_base_model_of_a_warm_start(tmp_path, channels, run_train, capsys):
+    base_dir = tmp_path / "base"
+    run_train(
+        "--data-dir", channels["train"], "--validation-dir", channels["validation"], "--model-dir", base_dir,
+        "--num_round", 10, "--eta", 0.05
+    )
+    capsys.readouterr()
+
+    model, best_iteration, boosted = train_with_early_stopping(
+        tmp_path, channels, run_train, capsys, "model", "--model_channel", base_dir, "--warm_start_rounds", 200
+    )
+
+    # best_iteration counts the base model's 10 rounds too
+    assert 10 <= best_iteration < 10 + boosted
+    assert boosted == best_iteration - 10 + 1 + 5 < 200
+    assert model.num_boosted_rounds() == best_iteration + 1
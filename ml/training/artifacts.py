@@ -0,0 +1,78 @@
+# Model artifacts - reads only the model file out of a model.tar.gz, after checking the members it passes,
+# into memory or into a cache directory keyed by the tarball's sha256. No xgboost import, so evaluate.py's
+# numpy predictor can use it
+
+import os
+import shutil
+import tarfile
+import tempfile
+
+from schema import file_sha256
+from tree_model import MODEL_JSON_FILE
+
+# format -> file name inside the model dir / model.tar.gz. "bst" is the legacy binary on the 1.7 image
+MODEL_FILES = {
+    "bst": "model.bst",
+    "json": MODEL_JSON_FILE,
+    "ubj": "model.ubj"
+}
+
+# extracted models, one <sha256 of the tarball>/ directory each
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "model-artifacts")
+
+
+def member_name(member):
+    """
+    Normalized name of a tar member ("./model.bst" -> "model.bst"). Raises ValueError for absolute paths,
+    names that climb out of the archive with "..", and anything but regular files and directories.
+    """
+    name = os.path.normpath(member.name)
+    if os.path.isabs(name) or name == ".." or name.startswith(".." + os.sep):
+        raise ValueError(f"Unsafe path in model archive: {member.name}")
+    if not (member.isfile() or member.isdir()):
+        raise ValueError(f"Unsupported member type in model archive: {member.name}")
+    return name
+
+
+def _open_model(tar):
+    """(name, file object) of the first model file in a streamed tarball, checking every member up to it."""
+    for member in tar:
+        name = member_name(member)
+        if member.isfile() and name in MODEL_FILES.values():
+            return name, tar.extractfile(member)
+    return None, None
+
+
+def read_model_bytes(tar_path):
+    """(model file name, bytes) from a model.tar.gz, decompressed only up to the model. None when it holds none."""
+    # "r|gz" streams the archive, so members after the model are never decompressed
+    with tarfile.open(tar_path, "r|gz") as tar:
+        name, member = _open_model(tar)
+        if member is None:
+            return None
+        return name, member.read()
+
+
+def extract_model(tar_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Directory holding the model file of a model.tar.gz, under cache_dir/<sha256 of the tarball>. The
+    tarball is decompressed the first time only - later calls for the same bytes just hash it.
+    """
+    model_dir = os.path.join(cache_dir, file_sha256(tar_path))
+    if any(os.path.isfile(os.path.join(model_dir, name)) for name in MODEL_FILES.values()):
+        print(f"Model {tar_path} already extracted to {model_dir}")
+        return model_dir
+
+    os.makedirs(model_dir, exist_ok=True)
+    with tarfile.open(tar_path, "r|gz") as tar:
+        name, member = _open_model(tar)
+        if member is None:
+            raise FileNotFoundError(f"No model ({', '.join(MODEL_FILES.values())}) in {tar_path}")
+
+        # written under a temporary name and renamed, so an interrupted copy is never taken for a model
+        with tempfile.NamedTemporaryFile(dir=model_dir, prefix=".", delete=False) as f:
+            shutil.copyfileobj(member, f)
+        os.replace(f.name, os.path.join(model_dir, name))
+
+    print(f"Model {tar_path} extracted to {model_dir}")
+    return model_dir
@@ -0,0 +1,225 @@
+# Training callbacks - periodic checkpoints so an interrupted (spot) job can resume where it stopped,
+# and a per-round profile of where the training time and memory go
+
+import csv
+import hashlib
+import json
+import os
+import re
+import resource
+import time
+import xgboost as xgb
+from contextlib import contextmanager
+
+# SageMaker syncs this directory with the estimator's checkpoint_s3_uri
+DEFAULT_CHECKPOINT_DIR = "/opt/ml/checkpoints"
+
+CHECKPOINT_PREFIX = "xgboost-checkpoint"
+# xgboost-checkpoint.<key digest>.NNNNN.json, the digest is left out for checkpoints written without a key
+_CHECKPOINT_PATTERN = re.compile(rf"^{CHECKPOINT_PREFIX}\.(?:([0-9a-f]{{12}})\.)?(\d+)\.json$")
+
+# booster attribute tying a checkpoint to the run that wrote it - see checkpoint_key()
+CHECKPOINT_KEY_ATTR = "checkpoint_key"
+
+# profile files go in a subdirectory - the serving container treats every top level file in the model dir as a model
+PROFILE_DIR = "profile"
+
+
+def _key_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:12] if key is not None else None
+
+
+def checkpoint_path(checkpoint_dir, rounds, key=None):
+    digest = _key_digest(key)
+    name = f"{CHECKPOINT_PREFIX}.{digest}.{rounds:05d}.json" if digest else f"{CHECKPOINT_PREFIX}.{rounds:05d}.json"
+    return os.path.join(checkpoint_dir, name)
+
+
+def checkpoint_key(params, num_rows):
+    """
+    Identifies a training run for its checkpoints - the training params (less nthread, which follows the
+    instance) and the number of training rows. A checkpoint with another key belongs to a different run.
+    """
+    key = {name: value for name, value in params.items() if name != "nthread"}
+    key["num_rows"] = int(num_rows)
+    return json.dumps(key, sort_keys=True)
+
+
+def list_checkpoints(checkpoint_dir, key=None):
+    """
+    (rounds, path) of every checkpoint in the directory written with the key, oldest first. Runs sharing
+    the directory (tuning trials of one execution) each only see their own.
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return []
+
+    digest = _key_digest(key)
+    checkpoints = []
+    for name in os.listdir(checkpoint_dir):
+        match = _CHECKPOINT_PATTERN.match(name)
+        if match and match.group(1) == digest:
+            checkpoints.append((int(match.group(2)), os.path.join(checkpoint_dir, name)))
+    return sorted(checkpoints)
+
+
+def load_latest_checkpoint(checkpoint_dir, key=None):
+    """
+    Booster from the newest readable checkpoint, or None when there is nothing to resume from.
+    With a key, only checkpoints written by a run with the same checkpoint_key() are considered.
+    """
+    for rounds, path in reversed(list_checkpoints(checkpoint_dir, key)):
+        try:
+            booster = xgb.Booster(model_file=path)
+        except xgb.core.XGBoostError as e:
+            # a job killed mid-write leaves at most the temp file, but S3 sync can still hand us a partial one
+            print(f"WARNING: skipping unreadable checkpoint {path}: {e}")
+            continue
+
+        # the digest in the name is short, the attribute holds the whole key
+        if key is not None and booster.attr(CHECKPOINT_KEY_ATTR) != key:
+            print(f"WARNING: skipping checkpoint {path} - written with other params or data")
+            continue
+
+        # the key only belongs on checkpoints, not on the model trained from this one
+        booster.set_attr(**{CHECKPOINT_KEY_ATTR: None})
+
+        print(f"Resuming from checkpoint {path} ({rounds} rounds)")
+        return booster
+
+    return None
+
+
+class CheckpointCallback(xgb.callback.TrainingCallback):
+    """
+    Saves the booster every `interval` rounds, keeping the newest `max_to_keep` checkpoints. Checkpoints
+    are named by the booster's total rounds, so a resumed run carries on the numbering of the one it
+    resumed. With a key (checkpoint_key()) every checkpoint records it for load_latest_checkpoint() and
+    carries a digest of it in its name, so runs sharing the directory neither overwrite nor prune each other's.
+    """
+
+    def __init__(self, checkpoint_dir, interval, max_to_keep=3, key=None):
+        self._checkpoint_dir = checkpoint_dir
+        self._interval = interval
+        self._max_to_keep = max_to_keep
+        self._key = key
+        self._start_rounds = 0
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        super().__init__()
+
+    def before_training(self, model):
+        # xgb.train counts epochs from 0 even when it continues an xgb_model=, like xgboost's own
+        # TrainingCheckPoint the rounds already in the model are added on
+        self._start_rounds = model.num_boosted_rounds()
+        if self._key is not None:
+            model.set_attr(**{CHECKPOINT_KEY_ATTR: self._key})
+        return model
+
+    def after_training(self, model):
+        if self._key is not None:
+            model.set_attr(**{CHECKPOINT_KEY_ATTR: None})
+        return model
+
+    def _save(self, model, rounds):
+        path = checkpoint_path(self._checkpoint_dir, rounds, self._key)
+
+        # write then rename so a kill during the save never leaves a truncated checkpoint under the real name.
+        # the temp name keeps the .json extension - xgboost picks the format from it
+        tmp_path = os.path.join(self._checkpoint_dir, f".{os.path.basename(path)}")
+        model.save_model(tmp_path)
+        os.replace(tmp_path, path)
+
+        # checkpoints past this one are ones the resume skipped as unreadable - they must not count
+        # towards the newest kept, or they would push the readable ones out
+        earlier = [(r, p) for r, p in list_checkpoints(self._checkpoint_dir, self._key) if r <= rounds]
+        for _, old_path in earlier[:-self._max_to_keep]:
+            os.remove(old_path)
+
+    def after_iteration(self, model, epoch, evals_log):
+        rounds = self._start_rounds + epoch + 1
+        if rounds % self._interval == 0:
+            self._save(model, rounds)
+        return False
+
+
+def rss_mb():
+    """Current resident set size - from /proc where available, else the peak reported by getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ProfilingCallback(xgb.callback.TrainingCallback):
+    """
+    Records wall time, CPU time, RSS and the eval metrics of every boosting round, plus named stages
+    (data load, DMatrix construction) timed with stage(). Each measurement is printed as a
+    `profile:` line for the SageMaker metric regexes, and save() writes profile.json and profile.csv.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.rounds = []
+        self._round_start = None
+        super().__init__()
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield
+        self.stages[name] = {
+            "wall_seconds": time.perf_counter() - wall,
+            "cpu_seconds": time.process_time() - cpu,
+            "rss_mb": rss_mb()
+        }
+        print(f"profile:{name}_seconds={self.stages[name]['wall_seconds']:.6f};")
+
+    def before_iteration(self, model, epoch, evals_log):
+        self._round_start = (time.perf_counter(), time.process_time())
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        wall, cpu = self._round_start
+        row = {
+            "round": epoch,
+            "wall_seconds": time.perf_counter() - wall,
+            "cpu_seconds": time.process_time() - cpu,
+            "rss_mb": rss_mb()
+        }
+
+        # latest value of every metric on every eval set, e.g. validation-mlogloss
+        for data_name, metrics in evals_log.items():
+            for metric_name, history in metrics.items():
+                row[f"{data_name}-{metric_name}"] = float(history[-1])
+
+        self.rounds.append(row)
+        print(
+            f"profile:round={epoch};round_wall_seconds={row['wall_seconds']:.6f};"
+            f"round_cpu_seconds={row['cpu_seconds']:.6f};rss_mb={row['rss_mb']:.1f};"
+        )
+        return False
+
+    def summary(self):
+        return {
+            "rounds": len(self.rounds),
+            "boosting_wall_seconds": sum(row["wall_seconds"] for row in self.rounds),
+            "boosting_cpu_seconds": sum(row["cpu_seconds"] for row in self.rounds),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+
+    def save(self, model_dir):
+        """Writes profile.json (stages, rounds, summary) and profile.csv (one row per round). Returns the directory."""
+        profile_dir = os.path.join(model_dir, PROFILE_DIR)
+        os.makedirs(profile_dir, exist_ok=True)
+
+        with open(os.path.join(profile_dir, "profile.json"), "w") as f:
+            json.dump({"summary": self.summary(), "stages": self.stages, "rounds": self.rounds}, f, indent=2)
+
+        fieldnames = list(dict.fromkeys(key for row in self.rounds for key in row))
+        with open(os.path.join(profile_dir, "profile.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames or ["round"])
+            writer.writeheader()
+            writer.writerows(self.rounds)
+
+        return profile_dir
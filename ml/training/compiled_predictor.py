@@ -0,0 +1,158 @@
+# Compiled tree inference - turns a booster into C (one nested if/else function per tree), builds it into a
+# shared library and predicts through ctypes. Falls back to the booster when there is no C compiler.
+
+import ctypes
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import numpy as np
+import xgboost as xgb
+
+from tree_model import parse_model, transform
+
+# built libraries are named after the digest of their source, so a model is only compiled once per machine
+DEFAULT_BUILD_DIR = os.path.join(tempfile.gettempdir(), "xgboost-compiled")
+
+PREDICTOR_KINDS = ("booster", "compiled")
+
+
+def _float_literal(value):
+    # 9 significant digits round-trip a float32 exactly; the exponent keeps whole numbers valid float literals
+    return f"{float(value):.8e}f"
+
+
+def _tree_source(tree, node, indent):
+    pad = "    " * indent
+    if tree.is_leaf(node):
+        return f"{pad}out[group] += {_float_literal(tree.split_condition[node])};\n"
+
+    feature = tree.split_index[node]
+    condition = _float_literal(tree.split_condition[node])
+
+    # xgboost goes left on x < condition, and missing values follow default_left (NaN < c is false)
+    if tree.default_left[node]:
+        test = f"isnan(x[{feature}]) || x[{feature}] < {condition}"
+    else:
+        test = f"x[{feature}] < {condition}"
+
+    return (
+        f"{pad}if ({test}) {{\n"
+        f"{_tree_source(tree, tree.left[node], indent + 1)}"
+        f"{pad}}} else {{\n"
+        f"{_tree_source(tree, tree.right[node], indent + 1)}"
+        f"{pad}}}\n"
+    )
+
+
+def generate_source(ensemble):
+    """C source with predict_margin(data, n_rows, out) - row-major float32 features in, margins out."""
+    lines = ["#include <math.h>", "#include <stdint.h>", ""]
+
+    for i, tree in enumerate(ensemble.trees):
+        lines.append(f"static void tree_{i}(const float* x, float* out, int group) {{")
+        lines.append(_tree_source(tree, 0, 1).rstrip("\n"))
+        lines.append("}")
+        lines.append("")
+
+    base_margin = ", ".join(_float_literal(value) for value in ensemble.base_margin)
+    lines.append(f"static const float base_margin[{ensemble.num_output}] = {{{base_margin}}};")
+    lines.append("")
+    lines.append("void predict_margin(const float* data, int64_t n_rows, float* out) {")
+    lines.append("    for (int64_t row = 0; row < n_rows; ++row) {")
+    lines.append(f"        const float* x = data + row * {ensemble.num_feature};")
+    lines.append(f"        float* o = out + row * {ensemble.num_output};")
+    lines.append(f"        for (int k = 0; k < {ensemble.num_output}; ++k) o[k] = base_margin[k];")
+    for i, group in enumerate(ensemble.tree_group):
+        lines.append(f"        tree_{i}(x, o, {group});")
+    lines.append("    }")
+    lines.append("}")
+
+    return "\n".join(lines) + "\n"
+
+
+def compile_ensemble(ensemble, build_dir=DEFAULT_BUILD_DIR, compiler=None):
+    """Builds the ensemble into a shared library (reusing an earlier build of the same source). Returns its path."""
+    source = generate_source(ensemble)
+    digest = hashlib.sha256(source.encode()).hexdigest()[:16]
+    lib_path = os.path.join(build_dir, f"trees-{digest}.so")
+
+    if os.path.exists(lib_path):
+        return lib_path
+
+    os.makedirs(build_dir, exist_ok=True)
+    source_path = os.path.join(build_dir, f"trees-{digest}.c")
+    with open(source_path, "w") as f:
+        f.write(source)
+
+    # build under a temporary name so a concurrent or interrupted build never leaves a half written library
+    tmp_path = f"{lib_path}.{os.getpid()}.tmp"
+    compiler = compiler or os.environ.get("CC", "cc")
+    result = subprocess.run(
+        [compiler, "-O2", "-shared", "-fPIC", "-o", tmp_path, source_path, "-lm"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise OSError(f"{compiler} failed to build {source_path}:\n{result.stderr[-2000:]}")
+    os.replace(tmp_path, lib_path)
+    return lib_path
+
+
+class CompiledPredictor:
+    """Predicts like Booster.predict with a compiled ensemble."""
+
+    kind = "compiled"
+
+    def __init__(self, ensemble, build_dir=DEFAULT_BUILD_DIR, compiler=None):
+        self._ensemble = ensemble
+        self.lib_path = compile_ensemble(ensemble, build_dir, compiler)
+
+        self._lib = ctypes.CDLL(self.lib_path)
+        self._lib.predict_margin.restype = None
+        self._lib.predict_margin.argtypes = [
+            np.ctypeslib.ndpointer(np.float32, flags="C_CONTIGUOUS"),
+            ctypes.c_int64,
+            np.ctypeslib.ndpointer(np.float32, flags="C_CONTIGUOUS")
+        ]
+
+    def predict_margin(self, X):
+        data = np.ascontiguousarray(X, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] != self._ensemble.num_feature:
+            raise ValueError(f"Expected an (n, {self._ensemble.num_feature}) feature array, got {data.shape}")
+
+        out = np.empty((data.shape[0], self._ensemble.num_output), dtype=np.float32)
+        self._lib.predict_margin(data, data.shape[0], out)
+        return out
+
+    def predict(self, X):
+        return transform(self.predict_margin(X), self._ensemble.objective)
+
+
+class BoosterPredictor:
+    """The same predict(X) interface straight on the booster."""
+
+    kind = "booster"
+
+    def __init__(self, booster):
+        self._booster = booster
+
+    def predict(self, X):
+        # plain arrays carry no column names, so they get the ones the booster was trained with
+        feature_names = None if hasattr(X, "columns") else self._booster.feature_names
+        return self._booster.predict(xgb.DMatrix(X, feature_names=feature_names))
+
+
+def make_predictor(booster, kind="compiled", build_dir=DEFAULT_BUILD_DIR):
+    """
+    Predictor for a loaded booster. A compiled one when asked for and possible - no compiler, a
+    failed build or an unsupported model (objective, categorical splits) fall back to the booster.
+    """
+    if kind == "compiled":
+        try:
+            return CompiledPredictor(parse_model(json.loads(booster.save_raw("json"))), build_dir)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: could not compile the model, predicting with the booster: {e}")
+
+    return BoosterPredictor(booster)
@@ -0,0 +1,60 @@
+# Binary DMatrix cache - lets repeated tuning trials skip parsing the split files
+
+import hashlib
+import os
+import pandas as pd
+import xgboost as xgb
+
+from schema import DMATRIX_CACHE_SUFFIX, FEATURE_COLUMNS, LABEL_COLUMN, file_sha256, list_data_files, read_split
+
+# the binary format is tied to the xgboost release that wrote it
+XGBOOST_VERSION = ".".join(xgb.__version__.split(".")[:2])
+
+
+def content_digest(file_digests):
+    """Digest of a set of data files - independent of file names and order."""
+    return hashlib.sha256("\n".join(sorted(file_digests)).encode()).hexdigest()
+
+
+def cache_name(digest):
+    return f"dmatrix-{digest[:16]}-xgb{XGBOOST_VERSION}{DMATRIX_CACHE_SUFFIX}"
+
+
+def write_cache(paths, output_path, file_digests=None):
+    """
+    Builds a DMatrix (features + labels) from the given split files and saves it as an XGBoost
+    binary buffer at output_path/<cache_name>. Returns the path of the buffer.
+    """
+    file_digests = file_digests or [file_sha256(path) for path in paths]
+
+    df = pd.concat([read_split(path) for path in sorted(paths)], ignore_index=True)
+    dmatrix = xgb.DMatrix(df.drop(LABEL_COLUMN, axis=1), label=df[LABEL_COLUMN])
+
+    cache_path = os.path.join(output_path, cache_name(content_digest(file_digests)))
+    dmatrix.save_binary(cache_path)
+    return cache_path
+
+
+def load_cached_dmatrix(channel_dir):
+    """
+    Loads the binary buffer in channel_dir whose name matches the digest of the channel's data
+    files. Returns None when there is no such buffer or it cannot be read, so callers parse instead.
+    """
+    cached = [name for name in os.listdir(channel_dir) if name.endswith(DMATRIX_CACHE_SUFFIX)]
+    if not cached:
+        return None
+
+    expected = cache_name(content_digest([file_sha256(path) for path in list_data_files(channel_dir)]))
+    if expected not in cached:
+        print(f"DMatrix cache in {channel_dir} is stale or from another xgboost version, parsing data files")
+        return None
+
+    try:
+        dmatrix = xgb.DMatrix(os.path.join(channel_dir, expected))
+    except xgb.core.XGBoostError as e:
+        print(f"WARNING: Could not load DMatrix cache {expected}: {e}")
+        return None
+
+    dmatrix.feature_names = FEATURE_COLUMNS
+    print(f"Loaded DMatrix cache {expected} ({dmatrix.num_row()} rows)")
+    return dmatrix
@@ -1,91 +1,137 @@
 # Testing XGBoost on unseen test data
 
+import argparse
 import json
 import os
-import pandas as pd
-import xgboost as xgb
-import tarfile
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+# shared modules (schema.py) sit next to this script locally and arrive as the "source" processing input on SageMaker
+SOURCE_DIR = "/opt/ml/processing/source"
+sys.path.append(SOURCE_DIR)
+
+from artifacts import DEFAULT_CACHE_DIR, extract_model
+from metrics import MetricAccumulator, bootstrap_intervals
+from schema import LABEL_COLUMN, LABEL_VOCABULARY, iter_split_batches, list_data_files
+from tree_model import MODEL_JSON_FILE
+
+# numpy scores model.json without importing xgboost, so the xgboost based predictors are imported on demand
+PREDICTORS = ("booster", "compiled", "numpy")
+
+# test rows predicted at a time - memory stays at one batch however large the test channel is
+DEFAULT_BATCH_ROWS = 100_000
+
+# per worker process, set once by init_worker
+_predictor = None
+
+
+def load_predictor(model_dir, kind, nthread=None):
+    """Predictor of the given kind for the model in model_dir (model.bst, model.json or model.ubj)."""
+    model_json_path = os.path.join(model_dir, MODEL_JSON_FILE)
+    if kind == "numpy" and os.path.exists(model_json_path):
+        from numpy_predictor import NumpyPredictor
+        return NumpyPredictor.from_json(model_json_path)
+
+    if kind == "numpy":
+        print(f"WARNING: no {MODEL_JSON_FILE} (train with model_format=json), predicting with the booster")
+
+    from compiled_predictor import make_predictor
+    from model_io import load_model
+
+    booster = load_model(model_dir)
+    if nthread:
+        booster.set_param({"nthread": nthread})
+    return make_predictor(booster, kind)
+
+
+def init_worker(model_dir, kind, nthread=None):
+    global _predictor
+    _predictor = load_predictor(model_dir, kind, nthread)
+
+
+def evaluate_file(path, batch_rows, num_class):
+    """Metric state of one test file, read and predicted batch by batch."""
+    accumulator = MetricAccumulator(num_class)
+    for batch in iter_split_batches(path, batch_rows):
+        accumulator.update(batch[LABEL_COLUMN], _predictor.predict(batch.drop(LABEL_COLUMN, axis=1)))
+    return accumulator
 
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 
 if __name__ == "__main__":
-    
+    parser = argparse.ArgumentParser()
+    # booster predicts with xgboost, compiled with the model built into a shared library, numpy with flat
+    # NumPy arrays from model.json - the last two fall back to the booster when they cannot be used
+    parser.add_argument("--predictor", type=str, choices=PREDICTORS, default="booster")
+    parser.add_argument("--batch_rows", type=int, default=DEFAULT_BATCH_ROWS)
+    # test files evaluated in parallel - 0 means one process per CPU, capped at the number of files
+    parser.add_argument("--workers", type=int, default=0)
+    # bootstrap confidence intervals written next to the point estimates - 0 resamples turns them off
+    parser.add_argument("--bootstrap_resamples", type=int, default=10_000)
+    parser.add_argument("--confidence_level", type=float, default=0.95)
+    parser.add_argument("--bootstrap_seed", type=int, default=0)
+    # models extracted from model.tar.gz, keyed by its sha256 - re-scoring the same model skips decompression
+    parser.add_argument("--artifact_cache_dir", type=str, default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
     # sagemaker processing paths
     model_dir = "/opt/ml/processing/model"
     test_data_dir = "/opt/ml/processing/test"
     output_dir = "/opt/ml/processing/evaluation"
 
-    # extracting the model saved as model.tar.gz
+    # the model file of model.tar.gz only - members are checked, nothing else is written
     model_tar_path = os.path.join(model_dir, "model.tar.gz")
     if os.path.exists(model_tar_path):
-        print(f"Extracting Model from: {model_tar_path}")
-
-        with tarfile.open(model_tar_path, "r:gz") as tar:
-            tar.extractall(path=model_dir)
-        print(f"Model extracted successfully to {model_dir}")
+        model_dir = extract_model(model_tar_path, args.artifact_cache_dir)
     else:
         print(f"Model not found at {model_tar_path}")
 
     #paths
-    model_path = os.path.join(model_dir, "model.bst")
-    test_data_path = os.path.join(test_data_dir, "iris.csv")
     output_path = os.path.join(output_dir, "evaluation.json")
 
-    #loading test data
-    df = pd.read_csv(test_data_path, header= None)
-    df.columns = ["Species", "SepalLength", "SepalWidth", "PetalLength", "PetalWidth"]
-    print(f"Test data shape: {df.shape}")
-
-    #Dropping Id
-    if "Id" in df.columns:
-        df = df.drop(columns = ["Id"])
-
-    # ensure labels are int
-    df['Species'] = df['Species'].astype(int)
-
-    #splitting features
-    X = df.drop("Species", axis = 1)
-    y = df["Species"]
-
-    #loading trained model
-    model = xgb.Booster()
-    model.load_model(model_path)
-
-    #running predictions
-    dtest = xgb.DMatrix(X)
-    predictions = model.predict(dtest)
-    preds_labels = predictions.argmax(axis=1)
-
-    class_names = [
-    "Iris-setosa",
-    "Iris-versicolor",
-    "Iris-virginica"
-    ]
-
-    #metrics
-    accuracy = accuracy_score(y, preds_labels)
-    conf_matrix = confusion_matrix(y, preds_labels)
-    class_report = classification_report(y, preds_labels, target_names= class_names, output_dict=True)
-
-    #claude metrics
-    metrics = {
-        "accuracy": float(accuracy),  
-        "confusion_matrix": conf_matrix.tolist(), 
-        "per_class_metrics": {  
-            class_name: {
-                "precision": class_report[class_name]["precision"],
-                "recall": class_report[class_name]["recall"],
-                "f1-score": class_report[class_name]["f1-score"],
-                "support": int(class_report[class_name]["support"])
-            }
-            for class_name in class_names
-        },
-        "macro_avg": {  
-            "precision": class_report["macro avg"]["precision"],
-            "recall": class_report["macro avg"]["recall"],
-            "f1-score": class_report["macro avg"]["f1-score"]
-        }
-    }
+    class_names = LABEL_VOCABULARY
+
+    #running predictions - every test file is read, predicted and counted batch by batch
+    # iris.csv / iris.parquet or part-NNNNN shards depending on the prepare_data output
+    test_files = list_data_files(test_data_dir)
+    if not test_files:
+        raise FileNotFoundError(f"No data files found in {test_data_dir}")
+
+    workers = min(args.workers or os.cpu_count() or 1, len(test_files))
+    num_classes = [len(class_names)] * len(test_files)
+    batch_rows = [args.batch_rows] * len(test_files)
+
+    #loading trained model - model.bst, model.json or model.ubj depending on train.py's model_format
+    if workers > 1:
+        # one predictor per worker, single threaded so the workers do not compete for the cores
+        print(f"Evaluating {len(test_files)} files with {workers} worker processes")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(model_dir, args.predictor, 1)
+        ) as pool:
+            states = list(pool.map(evaluate_file, test_files, batch_rows, num_classes))
+    else:
+        init_worker(model_dir, args.predictor)
+        print(f"Predicting with the {_predictor.kind} predictor")
+        states = list(map(evaluate_file, test_files, batch_rows, num_classes))
+
+    accumulator = reduce(MetricAccumulator.merge, states, MetricAccumulator(len(class_names)))
+    print(f"Test data: {accumulator.count} rows in {len(test_files)} file(s)")
+
+    #metrics - same evaluation.json layout the CheckAccuracyThreshold condition reads
+    metrics = accumulator.evaluation(class_names)
+    accuracy = metrics["accuracy"]
+
+    if args.bootstrap_resamples > 0:
+        metrics["confidence_intervals"] = bootstrap_intervals(
+            accumulator.confusion,
+            class_names,
+            args.bootstrap_resamples,
+            level=args.confidence_level,
+            seed=args.bootstrap_seed
+        )
 
     #saving metrics
     os.makedirs(output_dir, exist_ok=True)
@@ -100,17 +146,29 @@ if __name__ == "__main__":
     print("📈 EVALUATION RESULTS")
     print("="*60)
     print(f"\n🎯 Overall Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
+    print(f"📉 Log Loss: {metrics['logloss']:.4f}")
+    if "confidence_intervals" in metrics:
+        intervals = metrics["confidence_intervals"]
+        print(f"📏 {intervals['level']:.0%} CI ({intervals['resamples']} bootstrap resamples):")
+        print(f"  Accuracy: [{intervals['accuracy']['lower']:.4f}, {intervals['accuracy']['upper']:.4f}]")
+        print(f"  Macro F1: [{intervals['macro_f1']['lower']:.4f}, {intervals['macro_f1']['upper']:.4f}]")
     
     print(f"\n📊 Per-Class Performance:")
-    for class_name in class_names:
+    for class_name, class_metrics in metrics["per_class_metrics"].items():
         print(f"\n{class_name}:")
-        print(f"  Precision: {class_report[class_name]['precision']:.4f}")
-        print(f"  Recall:    {class_report[class_name]['recall']:.4f}")
-        print(f"  F1-Score:  {class_report[class_name]['f1-score']:.4f}")
-        print(f"  Support:   {int(class_report[class_name]['support'])} samples")
+        print(f"  Precision: {class_metrics['precision']:.4f}")
+        print(f"  Recall:    {class_metrics['recall']:.4f}")
+        print(f"  F1-Score:  {class_metrics['f1-score']:.4f}")
+        print(f"  Support:   {class_metrics['support']} samples")
+        if "confidence_intervals" in metrics:
+            recall_interval = metrics["confidence_intervals"]["recall"][class_name]
+            if recall_interval["lower"] is None:
+                print(f"  Recall CI: undefined (class missing from the test data)")
+            else:
+                print(f"  Recall CI: [{recall_interval['lower']:.4f}, {recall_interval['upper']:.4f}]")
     
     print(f"\n🔢 Confusion Matrix:")
-    print(conf_matrix)
+    print(np.array(metrics["confusion_matrix"]))
     
     print(f"\n✅ Evaluation metrics saved to: {output_path}")
     print("="*60 + "\n")
@@ -0,0 +1,56 @@
+# External memory training - streams a channel through an XGBoost DataIter backed by an on-disk page cache
+
+import os
+import xgboost as xgb
+
+from schema import LABEL_COLUMN, iter_split_batches, list_data_files
+
+# rows handed to XGBoost per batch - peak memory is roughly one batch plus the quantised pages in use
+DEFAULT_BATCH_ROWS = 500_000
+
+
+class ChannelBatchIterator(xgb.DataIter):
+    """Feeds every data file of a channel to XGBoost in batches of batch_rows rows."""
+
+    def __init__(self, channel_dir, batch_rows, cache_prefix):
+        self._paths = list_data_files(channel_dir)
+        if not self._paths:
+            raise FileNotFoundError(f"No data files found in {channel_dir}")
+
+        self._batch_rows = batch_rows
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def _iter_batches(self):
+        for path in self._paths:
+            yield from iter_split_batches(path, self._batch_rows)
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self._iter_batches()
+
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+
+        input_data(data=batch.drop(LABEL_COLUMN, axis=1), label=batch[LABEL_COLUMN])
+        return True
+
+    def reset(self):
+        self._batches = None
+
+
+def load_external_dmatrix(channel_dir, cache_dir, batch_rows=DEFAULT_BATCH_ROWS, max_bin=256, ref=None):
+    """
+    Builds an external memory matrix for a channel. Pages are written under cache_dir, so the data
+    never has to fit in RAM. Validation matrices pass the training matrix as ref to share its bins.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    channel_name = os.path.basename(os.path.normpath(channel_dir))
+    data_iter = ChannelBatchIterator(channel_dir, batch_rows, os.path.join(cache_dir, channel_name))
+
+    if hasattr(xgb, "ExtMemQuantileDMatrix"):
+        return xgb.ExtMemQuantileDMatrix(data_iter, max_bin=max_bin, ref=ref)
+
+    # xgboost < 3.0 (the 1.7 training image) - paged DMatrix, quantised by the hist tree method
+    return xgb.DMatrix(data_iter)
@@ -0,0 +1,56 @@
+# Inference entry point for the SageMaker XGBoost container (script mode) - CSV or JSON rows in,
+# class probabilities out. INFERENCE_PREDICTOR=compiled serves through the compiled tree library.
+
+import io
+import json
+import os
+import numpy as np
+
+from compiled_predictor import make_predictor
+from model_io import load_model
+from schema import FEATURE_COLUMNS, FEATURE_DTYPE
+
+PREDICTOR_KIND = os.environ.get("INFERENCE_PREDICTOR", "booster")
+
+
+def model_fn(model_dir):
+    return make_predictor(load_model(model_dir), PREDICTOR_KIND)
+
+
+def input_fn(request_body, request_content_type):
+    """Feature rows without a label column - headerless CSV or a JSON list of rows ({"instances": [...]} too)."""
+    if isinstance(request_body, bytes):
+        request_body = request_body.decode("utf-8")
+
+    if request_content_type == "text/csv":
+        rows = np.loadtxt(io.StringIO(request_body), delimiter=",", dtype=FEATURE_DTYPE, ndmin=2)
+    elif request_content_type == "application/json":
+        payload = json.loads(request_body)
+        if isinstance(payload, dict):
+            if "instances" not in payload:
+                raise ValueError('JSON object without "instances"')
+            payload = payload["instances"]
+        # a single flat row is one row of features, not one feature per row
+        rows = np.atleast_2d(np.asarray(payload, dtype=FEATURE_DTYPE))
+    else:
+        raise ValueError(f"Unsupported content type: {request_content_type}")
+
+    if rows.ndim != 2 or rows.shape[1] != len(FEATURE_COLUMNS):
+        raise ValueError(
+            f"Expected rows of {len(FEATURE_COLUMNS)} features ({', '.join(FEATURE_COLUMNS)}), got shape {rows.shape}"
+        )
+    return rows
+
+
+def predict_fn(input_data, model):
+    return model.predict(input_data)
+
+
+def output_fn(prediction, accept):
+    if accept == "application/json":
+        return json.dumps({"predictions": np.asarray(prediction).tolist()}), accept
+
+    # CSV by default, one row of class probabilities per input row
+    buffer = io.StringIO()
+    np.savetxt(buffer, np.atleast_2d(prediction), delimiter=",", fmt="%.8g")
+    return buffer.getvalue(), "text/csv"
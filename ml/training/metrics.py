@@ -0,0 +1,126 @@
+# Classification metrics from running counts - batches update a confusion matrix and a logloss sum,
+# evaluation.json is derived from them at the end, so memory does not grow with the size of the test set.
+# States of different shards merge into the state of all of them, and bootstrap intervals are drawn from the merged state.
+
+import math
+import numpy as np
+
+# probabilities are clipped before the log, as sklearn's log_loss does
+_EPS = np.finfo(np.float64).eps
+
+
+class MetricAccumulator:
+    """
+    Confusion matrix (rows: true class, columns: predicted class) and logloss built up one batch at a time.
+    The logloss is kept as the exactly rounded sum of each batch, summed exactly again at the end, so the
+    result does not depend on the order batches or merged states arrive in.
+    """
+
+    def __init__(self, num_class):
+        self.num_class = num_class
+        self.confusion = np.zeros((num_class, num_class), dtype=np.int64)
+        self.logloss_sums = []
+
+    def update(self, y_true, probabilities):
+        y_true = np.asarray(y_true, dtype=np.int64)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        y_pred = probabilities.argmax(axis=1)
+
+        self.confusion += np.bincount(
+            y_true * self.num_class + y_pred, minlength=self.num_class ** 2
+        ).reshape(self.num_class, self.num_class)
+
+        p_true = np.clip(probabilities[np.arange(len(y_true)), y_true], _EPS, 1.0)
+        self.logloss_sums.append(math.fsum(-np.log(p_true)))
+
+    def merge(self, other):
+        """Adds another accumulator's counts (e.g. another shard's) to this one. Returns self."""
+        self.confusion += other.confusion
+        self.logloss_sums.extend(other.logloss_sums)
+        return self
+
+    @property
+    def count(self):
+        return int(self.confusion.sum())
+
+    def evaluation(self, class_names):
+        """
+        The evaluation.json metrics - accuracy, confusion matrix, per-class and macro precision/recall/F1 -
+        with the same keys and definitions as classification_report (a class never predicted has precision 0),
+        plus the mean logloss. Values agree with it up to float rounding: sklearn releases differ in how they
+        compute F1, so the last digit can too.
+        """
+        tp = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        support = self.confusion.sum(axis=1)
+
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        # 2tp / (2tp + fp + fn), the form recent sklearn releases use - older ones take the harmonic mean of
+        # precision and recall, which rounds differently
+        f1_denominator = predicted + support
+        f1 = np.divide(2 * tp, f1_denominator, out=np.zeros_like(tp), where=f1_denominator > 0)
+
+        return {
+            "accuracy": float(tp.sum() / self.count),
+            "confusion_matrix": self.confusion.tolist(),
+            "per_class_metrics": {
+                class_name: {
+                    "precision": float(precision[i]),
+                    "recall": float(recall[i]),
+                    "f1-score": float(f1[i]),
+                    "support": int(support[i])
+                }
+                for i, class_name in enumerate(class_names)
+            },
+            "macro_avg": {
+                "precision": float(np.average(precision)),
+                "recall": float(np.average(recall)),
+                "f1-score": float(np.average(f1))
+            },
+            "logloss": math.fsum(self.logloss_sums) / self.count
+        }
+
+
+def bootstrap_intervals(confusion, class_names, resamples, level=0.95, seed=0):
+    """
+    Percentile bootstrap intervals for accuracy, macro F1 and per-class recall. A row only contributes its
+    confusion cell, so resampling n rows with replacement is one multinomial draw of n over the cells with
+    the observed cell shares - all resamples come out of a single (resamples x cells) draw, whatever n is.
+    Recall of a class missing from a resample is undefined and left out of that class's interval; when a
+    class is missing from every resample its bounds are None (null in evaluation.json).
+    """
+    confusion = np.asarray(confusion, dtype=np.int64)
+    num_class = len(confusion)
+    n = int(confusion.sum())
+
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(n, confusion.ravel() / n, size=resamples)
+    counts = counts.reshape(resamples, num_class, num_class).astype(np.float64)
+
+    tp = np.diagonal(counts, axis1=1, axis2=2)
+    predicted = counts.sum(axis=1)
+    support = counts.sum(axis=2)
+
+    accuracy = tp.sum(axis=1) / n
+    recall = np.divide(tp, support, out=np.full_like(tp, np.nan), where=support > 0)
+    f1_denominator = predicted + support
+    f1 = np.divide(2 * tp, f1_denominator, out=np.zeros_like(tp), where=f1_denominator > 0)
+    macro_f1 = f1.mean(axis=1)
+
+    quantiles = [(1 - level) / 2, (1 + level) / 2]
+
+    def interval(values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {"lower": None, "upper": None}
+        lower, upper = np.quantile(values, quantiles)
+        return {"lower": float(lower), "upper": float(upper)}
+
+    return {
+        "level": level,
+        "resamples": resamples,
+        "accuracy": interval(accuracy),
+        "macro_f1": interval(macro_f1),
+        "recall": {class_name: interval(recall[:, i]) for i, class_name in enumerate(class_names)}
+    }
@@ -0,0 +1,46 @@
+# Model serialization - the file name decides the format, so saving and loading share one table
+
+import os
+import xgboost as xgb
+
+from artifacts import MODEL_FILES, read_model_bytes
+
+DEFAULT_MODEL_FORMAT = "bst"
+
+
+def save_model(booster, model_dir, model_format=DEFAULT_MODEL_FORMAT):
+    """Saves the booster as model_dir/<MODEL_FILES[model_format]> and returns the path."""
+    if model_format not in MODEL_FILES:
+        raise ValueError(f"Unknown model format '{model_format}', expected one of {list(MODEL_FILES)}")
+
+    os.makedirs(model_dir, exist_ok=True)
+    model_path = os.path.join(model_dir, MODEL_FILES[model_format])
+    booster.save_model(model_path)
+    return model_path
+
+
+def find_model_file(model_dir):
+    """Path of the model in model_dir, whichever format it was saved in. None when there is none."""
+    for name in MODEL_FILES.values():
+        path = os.path.join(model_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_model(model_dir):
+    """Booster from model_dir, whichever format it was saved in."""
+    model_path = find_model_file(model_dir)
+    if model_path is None:
+        raise FileNotFoundError(f"No model ({', '.join(MODEL_FILES.values())}) found in {model_dir}")
+
+    return xgb.Booster(model_file=model_path)
+
+
+def load_model_from_tarball(tar_path):
+    """Booster from a model.tar.gz, read in memory without extracting it. None when it holds no model."""
+    model = read_model_bytes(tar_path)
+    if model is None:
+        return None
+    # the buffer loader detects the format from the bytes
+    return xgb.Booster(model_file=bytearray(model[1]))
@@ -0,0 +1,91 @@
+# NumPy tree evaluator - scores a model.json with flat node arrays and no xgboost import, for evaluate.py
+# and small scorers where importing xgboost costs more than the prediction
+
+import numpy as np
+
+from tree_model import load_model_json, transform
+
+# rows scored per traversal - bounds the (rows x trees) node index matrix
+DEFAULT_BATCH_ROWS = 4096
+
+
+class NumpyPredictor:
+    """
+    Every tree of the ensemble concatenated into flat per-node arrays (feature, threshold, left, right,
+    default_left, leaf value). Leaves point at themselves, so one vectorized step per tree level moves
+    all rows down all trees at once, and rows that reached a leaf stay there.
+    """
+
+    kind = "numpy"
+
+    def __init__(self, ensemble, batch_rows=DEFAULT_BATCH_ROWS):
+        self._objective = ensemble.objective
+        self._num_feature = ensemble.num_feature
+        self._base_margin = ensemble.base_margin
+        self._batch_rows = batch_rows
+
+        sizes = np.array([len(tree) for tree in ensemble.trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        self._roots = offsets.astype(np.int64)
+
+        self._feature = np.concatenate([tree.split_index for tree in ensemble.trees]).astype(np.int64)
+        self._threshold = np.concatenate([tree.split_condition for tree in ensemble.trees])
+        self._default_left = np.concatenate([tree.default_left for tree in ensemble.trees])
+
+        left = np.concatenate([tree.left + offset for tree, offset in zip(ensemble.trees, offsets)])
+        right = np.concatenate([tree.right + offset for tree, offset in zip(ensemble.trees, offsets)])
+        is_leaf = np.concatenate([tree.left == -1 for tree in ensemble.trees])
+
+        node_ids = np.arange(len(left))
+        self._left = np.where(is_leaf, node_ids, left)
+        self._right = np.where(is_leaf, node_ids, right)
+        self._feature[is_leaf] = 0
+
+        # leaves keep their value in split_condition, inner nodes add nothing
+        self._leaf_value = np.where(is_leaf, self._threshold, 0).astype(np.float32)
+
+        # (trees x outputs) one-hot, so summing leaf values per output is one matrix product
+        self._group_matrix = np.zeros((len(ensemble.trees), ensemble.num_output), dtype=np.float32)
+        self._group_matrix[np.arange(len(ensemble.trees)), ensemble.tree_group] = 1.0
+
+        self._depth = max(self._tree_depth(tree) for tree in ensemble.trees) if ensemble.trees else 0
+
+    @staticmethod
+    def _tree_depth(tree):
+        depth = np.zeros(len(tree), dtype=np.int64)
+        for node in range(len(tree)):
+            if tree.left[node] != -1:
+                depth[tree.left[node]] = depth[tree.right[node]] = depth[node] + 1
+        return int(depth.max())
+
+    @classmethod
+    def from_json(cls, path, batch_rows=DEFAULT_BATCH_ROWS):
+        return cls(load_model_json(path), batch_rows)
+
+    def _margin_batch(self, X):
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self._roots, (len(X), len(self._roots)))
+
+        for _ in range(self._depth):
+            values = X[rows, self._feature[nodes]]
+            # x < threshold goes left, missing values follow default_left
+            go_left = np.where(np.isnan(values), self._default_left[nodes], values < self._threshold[nodes])
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+
+        return self._base_margin + self._leaf_value[nodes] @ self._group_matrix
+
+    def predict_margin(self, X):
+        data = np.asarray(X, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] != self._num_feature:
+            raise ValueError(f"Expected an (n, {self._num_feature}) feature array, got {data.shape}")
+
+        if len(data) == 0:
+            return np.empty((0, len(self._base_margin)), dtype=np.float32)
+
+        return np.concatenate([
+            self._margin_batch(data[start:start + self._batch_rows])
+            for start in range(0, len(data), self._batch_rows)
+        ])
+
+    def predict(self, X):
+        return transform(self.predict_margin(X), self._objective)
@@ -0,0 +1,137 @@
+# Iris dataset schema - shared by prepare_data.py, train.py and evaluate.py
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+
+LABEL_COLUMN = "Species"
+
+# feature columns as they appear in data/raw/iris.csv and data/database.sqlite
+RAW_FEATURE_COLUMNS = ["SepalLengthCm", "SepalWidthCm", "PetalLengthCm", "PetalWidthCm"]
+
+# feature columns in the split files, label first as the container expects
+FEATURE_COLUMNS = ["SepalLength", "SepalWidth", "PetalLength", "PetalWidth"]
+COLUMNS = [LABEL_COLUMN] + FEATURE_COLUMNS
+
+# label vocabulary - position in the list is the numeric label
+LABEL_VOCABULARY = ["Iris-setosa", "Iris-versicolor", "Iris-virginica"]
+LABEL_MAPPING = {name: code for code, name in enumerate(LABEL_VOCABULARY)}
+
+LABEL_DTYPE = np.int8
+FEATURE_DTYPE = np.float32
+DTYPES = {LABEL_COLUMN: LABEL_DTYPE, **{col: FEATURE_DTYPE for col in FEATURE_COLUMNS}}
+
+# binary DMatrix caches live next to the split files but are not split data
+DMATRIX_CACHE_SUFFIX = ".buffer"
+
+# channels with more files than this are read by a thread pool (pyarrow and the csv parser release the GIL)
+PARALLEL_LOAD_MIN_FILES = 4
+
+
+def encode_chunk(df):
+    """
+    Validates a raw chunk (iris.csv / sqlite columns) and encodes it into the split layout:
+    label first as int8 codes, float32 features, Id dropped. The index is kept.
+    """
+    if LABEL_COLUMN not in df.columns:
+        raise ValueError(f"'{LABEL_COLUMN}' Column not found")
+
+    missing = [col for col in RAW_FEATURE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Feature columns not found: {missing}")
+
+    # categorical codes map the whole column at once, unknown species become -1
+    codes = pd.Categorical(df[LABEL_COLUMN], categories=LABEL_VOCABULARY).codes
+    if (codes < 0).any():
+        unexpected = sorted(df[LABEL_COLUMN][codes < 0].astype(str).unique())
+        raise ValueError(f"Label mapping failed. Unexpected {LABEL_COLUMN} values found: {unexpected}")
+
+    encoded = pd.DataFrame(
+        df[RAW_FEATURE_COLUMNS].to_numpy(dtype=FEATURE_DTYPE),
+        columns=FEATURE_COLUMNS,
+        index=df.index
+    )
+    encoded.insert(0, LABEL_COLUMN, codes.astype(LABEL_DTYPE))
+    return encoded
+
+
+def compact(df):
+    """Names and casts an already encoded split to the schema dtypes, without re-validating it."""
+    df.columns = COLUMNS
+    # copy-on-write leaves the columns that already have their dtype uncopied
+    return df.astype(DTYPES)
+
+
+def is_parquet(path):
+    """Parquet files start with the PAR1 magic bytes, the split CSVs never do."""
+    with open(path, "rb") as f:
+        return f.read(4) == b"PAR1"
+
+
+def read_split(path):
+    """Loads one split file - Parquet (detected by its magic bytes) directly, anything else as headerless CSV."""
+    if is_parquet(path):
+        df = pd.read_parquet(path)
+    elif os.path.getsize(path) == 0:
+        # empty shard
+        return compact(pd.DataFrame(columns=COLUMNS))
+    else:
+        df = pd.read_csv(path, header=None, dtype=dict(enumerate(DTYPES.values())))
+
+    if df.empty:
+        return compact(pd.DataFrame(columns=COLUMNS))
+
+    return compact(df)
+
+
+def iter_split_batches(path, batch_rows):
+    """Yields one split file as DataFrames of at most batch_rows rows, without loading the whole file."""
+    if is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            if batch.num_rows:
+                yield compact(batch.to_pandas())
+    elif os.path.getsize(path) > 0:
+        for chunk in pd.read_csv(path, header=None, dtype=dict(enumerate(DTYPES.values())), chunksize=batch_rows):
+            yield compact(chunk)
+
+
+def file_sha256(path, block_size=8 * 1024 * 1024):
+    """Hex sha256 of a file, read in blocks so large splits are not loaded at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_data_files(channel_dir):
+    """Data files in a channel - a single iris.csv/iris.parquet or part-NNNNN shards."""
+    return sorted(
+        os.path.join(channel_dir, name)
+        for name in os.listdir(channel_dir)
+        if not name.startswith(".")
+        and not name.endswith(DMATRIX_CACHE_SUFFIX)
+        and os.path.isfile(os.path.join(channel_dir, name))
+    )
+
+
+def load_channel(channel_dir):
+    """Reads every data file in the channel into one DataFrame."""
+    paths = list_data_files(channel_dir)
+    if not paths:
+        raise FileNotFoundError(f"No data files found in {channel_dir}")
+
+    if len(paths) >= PARALLEL_LOAD_MIN_FILES:
+        with ThreadPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as pool:
+            frames = list(pool.map(read_split, paths))
+    else:
+        frames = [read_split(path) for path in paths]
+
+    print(f"Loaded {len(paths)} file(s) from {channel_dir}")
+
+    # empty shards would turn every column into object dtype
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,217 @@
+# Local inference server with dynamic micro-batching - asyncio HTTP on the SageMaker serving contract
+# (GET /ping, POST /invocations) around inference.py's handlers. Requests arriving within max_wait_ms of
+# each other are merged into one predict call of up to max_batch_rows rows.
+#
+#   python3 serve.py --model-dir /tmp/model --port 8080 --max_batch_rows 256 --max_wait_ms 2
+
+import argparse
+import asyncio
+import time
+import numpy as np
+
+from inference import input_fn, model_fn, output_fn, predict_fn
+
+DEFAULT_MAX_BATCH_ROWS = 256
+DEFAULT_MAX_WAIT_MS = 2.0
+
+# body size limit - a request beyond this gets a 413 rather than being read into memory
+MAX_BODY_BYTES = 6 * 1024 * 1024
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class MicroBatcher:
+    """
+    Queues the rows of concurrent requests and predicts them together. A batch starts with the oldest
+    waiting request and takes more until it holds max_batch_rows rows or max_wait_ms has passed since
+    it started. max_batch_rows=1 predicts every request on its own.
+    """
+
+    def __init__(self, model, max_batch_rows=DEFAULT_MAX_BATCH_ROWS, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.rows = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, rows):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_rows:
+            # requests already queued join without waiting, the rest only until the deadline
+            if self._queue.empty():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _predict(self, rows):
+        """Predictions of each request's rows from one predict call on all of them."""
+        # in a worker thread, so the loop keeps reading requests for the next batch meanwhile
+        prediction = await asyncio.get_running_loop().run_in_executor(
+            None, predict_fn, np.concatenate(rows), self.model
+        )
+        self.batches += 1
+        self.rows += len(prediction)
+        return np.split(prediction, np.cumsum([len(r) for r in rows])[:-1])
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await self._predict([rows for rows, _ in batch])
+            except Exception as e:
+                results = [e]
+                if len(batch) > 1:
+                    # a malformed request fails the merged call - predict them one by one so only it fails
+                    results = []
+                    for rows, _ in batch:
+                        try:
+                            results.extend(await self._predict([rows]))
+                        except Exception as request_error:
+                            results.append(request_error)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+async def read_request(reader):
+    """(method, path, headers, body) of one HTTP/1.1 request, None when the client closed the connection."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        return method, path, headers, None
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+def write_response(writer, status, body=b"", content_type="text/plain"):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+
+
+async def handle_invocation(batcher, headers, body):
+    content_type = headers.get("content-type", "text/csv").split(";")[0].strip()
+    accept = headers.get("accept", "text/csv")
+    try:
+        rows = input_fn(body, content_type)
+    except ValueError as e:
+        return 400, str(e), "text/plain"
+
+    prediction = await batcher.predict(rows)
+    response, response_type = output_fn(prediction, accept)
+    return 200, response, response_type
+
+
+def make_handler(batcher):
+    async def handle(reader, writer):
+        try:
+            # keep-alive - requests on one connection are answered in order until the client closes it
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+
+                if body is None:
+                    write_response(writer, 413, f"Request body over {MAX_BODY_BYTES} bytes")
+                    await writer.drain()
+                    break
+                if method == "GET" and path == "/ping":
+                    write_response(writer, 200)
+                elif method == "POST" and path == "/invocations":
+                    try:
+                        write_response(writer, *await handle_invocation(batcher, headers, body))
+                    except Exception as e:
+                        write_response(writer, 500, f"{type(e).__name__}: {e}")
+                else:
+                    write_response(writer, 404)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(model_dir, host="0.0.0.0", port=8080, max_batch_rows=DEFAULT_MAX_BATCH_ROWS, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    batcher = MicroBatcher(model_fn(model_dir), max_batch_rows, max_wait_ms)
+    batcher.start()
+
+    server = await asyncio.start_server(make_handler(batcher), host, port)
+    print(f"Serving {model_dir} on {host}:{port} (max_batch_rows={max_batch_rows}, max_wait_ms={max_wait_ms})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+        if batcher.batches:
+            print(f"{batcher.rows} rows in {batcher.batches} predict calls ({batcher.rows / batcher.batches:.1f} rows per call)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default="/opt/ml/model")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    # 1 turns batching off - every request is predicted on its own
+    parser.add_argument("--max_batch_rows", type=int, default=DEFAULT_MAX_BATCH_ROWS)
+    parser.add_argument("--max_wait_ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.model_dir, args.host, args.port, args.max_batch_rows, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
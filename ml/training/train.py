@@ -2,11 +2,106 @@
 
 import argparse
 import os
+import time
 import pandas as pd
 import xgboost as xgb
+from contextlib import nullcontext
 
 from sklearn.metrics import accuracy_score, classification_report
 
+from callbacks import (
+    DEFAULT_CHECKPOINT_DIR, CheckpointCallback, ProfilingCallback, checkpoint_key, load_latest_checkpoint
+)
+from dmatrix_cache import load_cached_dmatrix
+from external_memory import DEFAULT_BATCH_ROWS, load_external_dmatrix
+from model_io import DEFAULT_MODEL_FORMAT, MODEL_FILES, find_model_file, load_model_from_tarball, save_model
+from schema import LABEL_COLUMN, list_data_files, load_channel
+
+
+def str2bool(value):
+    """SageMaker passes boolean hyperparameters as strings."""
+    return str(value).lower() in ("true", "1", "yes")
+
+
+def available_cpus():
+    """CPUs this container may use - SageMaker sets SM_NUM_CPUS, otherwise the scheduler affinity mask."""
+    if os.environ.get("SM_NUM_CPUS"):
+        return int(os.environ["SM_NUM_CPUS"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def load_base_model(model_dir):
+    """
+    Booster from the model channel - the model.tar.gz of an earlier training job, read in memory, or a
+    bare model file in any of the model_io formats. Returns None when the channel holds neither.
+    """
+    booster, path = None, find_model_file(model_dir)
+    if path is not None:
+        booster = xgb.Booster(model_file=path)
+    else:
+        for name in sorted(os.listdir(model_dir)):
+            if name.endswith(".tar.gz"):
+                path = os.path.join(model_dir, name)
+                booster = load_model_from_tarball(path)
+                if booster is None:
+                    raise FileNotFoundError(f"No model ({', '.join(MODEL_FILES.values())}) in {path}")
+                break
+
+    if booster is not None:
+        print(f"Loaded base model {path} ({booster.num_boosted_rounds()} rounds)")
+    return booster
+
+
+def load_dmatrix(channel_dir, tree_method="hist", max_bin=256, nthread=None, ref=None, profiler=None, name="train"):
+    """
+    DMatrix and labels for a channel - from the binary cache when it matches the data files, else parsed.
+
+    Parsed data goes straight into a QuantileDMatrix for the hist method, which skips the float copy a
+    DMatrix keeps. Validation passes the training matrix as ref so both use the same bin boundaries.
+    With a profiler, reading the data and building the matrix are timed as <name>_data_load and <name>_dmatrix.
+    """
+    stage = profiler.stage if profiler else (lambda _: nullcontext())
+
+    with stage(f"{name}_data_load"):
+        dmatrix = load_cached_dmatrix(channel_dir)
+        if dmatrix is None:
+            df = load_channel(channel_dir)
+
+    if dmatrix is not None:
+        return dmatrix, pd.Series(dmatrix.get_label().astype(int), name=LABEL_COLUMN)
+
+    X, y = df.drop(LABEL_COLUMN, axis=1), df[LABEL_COLUMN]
+
+    with stage(f"{name}_dmatrix"):
+        # a QuantileDMatrix can only take its bins from another QuantileDMatrix
+        if tree_method == "hist" and (ref is None or isinstance(ref, xgb.QuantileDMatrix)):
+            dmatrix = xgb.QuantileDMatrix(X, label=y, max_bin=max_bin, nthread=nthread, ref=ref)
+        else:
+            dmatrix = xgb.DMatrix(X, label=y, nthread=nthread)
+
+    return dmatrix, y
+
+
+def load_cv_dmatrix(train_dir, validation_dir=None, nthread=None, profiler=None):
+    """
+    One DMatrix over the train and validation channels for cross-validation. It stays a plain DMatrix
+    because xgb.cv slices it per fold, which a QuantileDMatrix does not support on the 1.7 image.
+    """
+    stage = profiler.stage if profiler else (lambda _: nullcontext())
+
+    with stage("train_data_load"):
+        frames = [load_channel(train_dir)]
+        if validation_dir and os.path.exists(validation_dir) and list_data_files(validation_dir):
+            frames.append(load_channel(validation_dir))
+        df = pd.concat(frames, ignore_index=True)
+
+    with stage("train_dmatrix"):
+        dmatrix = xgb.DMatrix(df.drop(LABEL_COLUMN, axis=1), label=df[LABEL_COLUMN], nthread=nthread)
+
+    return dmatrix, df[LABEL_COLUMN]
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -21,61 +116,116 @@ if __name__ == "__main__":
     parser.add_argument("--num_class", type=int, default=3)
     parser.add_argument("--objective", type=str, default="multi:softprob")
 
+    # tree construction - hist + QuantileDMatrix by default, nthread 0 means every CPU in the container
+    parser.add_argument("--tree_method", type=str, default="hist")
+    parser.add_argument("--max_bin", type=int, default=256)
+    parser.add_argument("--nthread", type=int, default=0)
+
+    # early stopping - rounds without validation mlogloss improvement before stopping, 0 disables it
+    parser.add_argument("--early_stopping_rounds", type=int, default=0)
+
+    # checkpoints - saved every checkpoint_interval rounds (0 disables them), training resumes from the newest
+    parser.add_argument("--checkpoint_dir", type=str, default=DEFAULT_CHECKPOINT_DIR)
+    parser.add_argument("--checkpoint_interval", type=int, default=0)
+
+    # external memory - stream the channels through a DataIter with an on-disk cache instead of loading them
+    parser.add_argument("--external_memory", type=str2bool, default=False)
+    parser.add_argument("--external_memory_dir", type=str, default="/tmp/xgboost-cache")
+    parser.add_argument("--batch_rows", type=int, default=DEFAULT_BATCH_ROWS)
+
+    # cross-validation - stratified k-fold over train + validation (0 or 1 disables it); the final model
+    # is then trained on all of it for the cross-validated number of rounds
+    parser.add_argument("--cv_folds", type=int, default=0)
+    parser.add_argument("--cv_seed", type=int, default=0)
+
+    # warm start - keep boosting a prior model (model channel) for warm_start_rounds on the new data,
+    # optionally also training from scratch to compare against
+    parser.add_argument("--model_channel", type=str, default=os.environ.get("SM_CHANNEL_MODEL"))
+    parser.add_argument("--warm_start_rounds", type=int, default=20)
+    parser.add_argument("--compare_full_retrain", type=str2bool, default=False)
+
+    # model file format - bst (legacy binary, what the built-in serving container expects), json or ubj
+    parser.add_argument("--model_format", type=str, choices=list(MODEL_FILES), default=DEFAULT_MODEL_FORMAT)
+
     args = parser.parse_args()
 
-    #loading dataset
-    data_path = os.path.join(args.data_dir, os.listdir(args.data_dir)[0])
-    print(f"Loading training data from: {data_path}")
+    nthread = args.nthread or available_cpus()
+    print(f"Using {nthread} threads")
 
-    df = pd.read_csv(data_path, header=None)
-    df.columns = ["Species", "SepalLength", "SepalWidth", "PetalLength", "PetalWidth"]
+    # per-round timing and memory, plus the data load / DMatrix stages below
+    profiler = ProfilingCallback()
 
-    print(f"Training data shape: {df.shape}")
-    print(f"Class distribution:\n {df['Species'].value_counts()}")
+    base_model = None
+    if args.model_channel and os.path.isdir(args.model_channel):
+        base_model = load_base_model(args.model_channel)
+        if base_model is None:
+            print(f"WARNING: No model found in {args.model_channel} - training from scratch")
 
-    #dropping "id" cause its not a feature
-    if "Id" in df.columns:
-        df = df.drop(columns = ["Id"])
+    cross_validate = args.cv_folds > 1
+    if cross_validate and base_model is not None:
+        # xgb.cv cannot continue a model, and the warm start needs the validation channel to compare
+        print(f"Warm starting - cross-validation skipped")
+        cross_validate = False
+    if cross_validate and args.external_memory:
+        raise ValueError("cv_folds cannot be combined with external_memory")
 
-    # ensures labels are int
-    df["Species"] = df["Species"].astype(int)
+    validation_dir = os.environ.get('SM_CHANNEL_VALIDATION', args.validation_dir)
+
+    #loading dataset
+    print(f"Loading training data from: {args.data_dir}")
 
-    #split features and target
     # No train_test_split - use ALL data for training
     # The pipeline provides pre-split data, so we train on the entire training set
-    X_train = df.drop("Species", axis=1)
-    y_train = df["Species"]
+    if cross_validate:
+        print(f"Cross-validation mode - {args.cv_folds} stratified folds over train + validation ({validation_dir})")
+        dtrain, y_train = load_cv_dmatrix(args.data_dir, validation_dir, nthread, profiler)
+
+        print(f"Cross-validation data shape: {(dtrain.num_row(), dtrain.num_col())}")
+        print(f"Class distribution:\n {y_train.value_counts()}")
+    elif args.external_memory:
+        print(f"External memory mode - batches of {args.batch_rows} rows, cache at {args.external_memory_dir}")
+        # batches are read while the matrix is built, so external memory has a single stage
+        with profiler.stage("train_dmatrix"):
+            dtrain = load_external_dmatrix(args.data_dir, args.external_memory_dir, args.batch_rows, args.max_bin)
 
-    dtrain = xgb.DMatrix(X_train, label = y_train)
+        print(f"Training data shape: {(dtrain.num_row(), dtrain.num_col())}")
+    else:
+        dtrain, y_train = load_dmatrix(args.data_dir, args.tree_method, args.max_bin, nthread, profiler=profiler)
+
+        print(f"Training data shape: {(dtrain.num_row(), dtrain.num_col())}")
+        print(f"Class distribution:\n {y_train.value_counts()}")
 
     evals = []
     dval = None
 
-    validation_dir = os.environ.get('SM_CHANNEL_VALIDATION', args.validation_dir)
     print(f"Checking validation dir: {validation_dir}")
 
     #claude
-    if validation_dir:
+    if cross_validate:
+        print(f"Validation data is part of the cross-validation folds")
+    elif validation_dir:
         if os.path.exists(validation_dir):
-            val_files = os.listdir(validation_dir)
+            val_files = list_data_files(validation_dir)
             print(f"Files in validation dir: {val_files}")
             
             if val_files:
-                val_path = os.path.join(validation_dir, val_files[0])
-                print(f"Loading validation data from: {val_path}")
+                print(f"Loading validation data from: {validation_dir}")
                 
-                df_val = pd.read_csv(val_path, header=None)
-                df_val.columns = ["Species", "SepalLength", "SepalWidth", "PetalLength", "PetalWidth"]
-                df_val["Species"] = df_val["Species"].astype(int)
-
-                X_val = df_val.drop("Species", axis=1)
-                y_val = df_val["Species"]
-
-                dval = xgb.DMatrix(X_val, label=y_val)
+                if args.external_memory:
+                    with profiler.stage("validation_dmatrix"):
+                        dval = load_external_dmatrix(
+                            validation_dir, args.external_memory_dir, args.batch_rows, args.max_bin, ref=dtrain
+                        )
+                    y_val = pd.Series(dval.get_label().astype(int), name=LABEL_COLUMN)
+                else:
+                    dval, y_val = load_dmatrix(
+                        validation_dir, args.tree_method, args.max_bin, nthread,
+                        ref=dtrain, profiler=profiler, name="validation"
+                    )
                 evals = [(dval, 'validation')]
                 
-                print(f"Validation Samples: {len(X_val)}")
-                print(f"Validation class distribution:\n{df_val['Species'].value_counts()}")
+                print(f"Validation Samples: {dval.num_row()}")
+                print(f"Validation class distribution:\n{y_val.value_counts()}")
             else:
                 print(f"WARNING: No files found in {validation_dir}")
         else:
@@ -91,23 +241,104 @@ if __name__ == "__main__":
         "num_class": args.num_class,
         "max_depth": args.max_depth,
         "eta": args.eta,
-        "eval_metric": "mlogloss"
+        "eval_metric": "mlogloss",
+        "tree_method": args.tree_method,
+        "max_bin": args.max_bin,
+        "nthread": nthread
     }
 
+    # paged data can only be trained with the histogram method
+    if args.external_memory:
+        params["tree_method"] = "hist"
+
+    # cross-validated metrics replace the single validation split - and pick the number of rounds
+    num_round = args.num_round
+    if cross_validate:
+        with profiler.stage("cv"):
+            cv_results = xgb.cv(
+                params = params,
+                dtrain = dtrain,
+                num_boost_round = args.num_round,
+                nfold = args.cv_folds,
+                stratified = True,
+                seed = args.cv_seed,
+                early_stopping_rounds = args.early_stopping_rounds or None,
+                verbose_eval = True
+            )
+
+        # with early stopping the results end at the best round
+        num_round = len(cv_results)
+        cv_mlogloss = cv_results["test-mlogloss-mean"].iloc[-1]
+        cv_mlogloss_std = cv_results["test-mlogloss-std"].iloc[-1]
+
+        print(f"\n{'='*60}")
+        print(f"CROSS-VALIDATION METRICS ({args.cv_folds} folds)")
+        print(f"{'='*60}")
+        print(f"validation:mlogloss={cv_mlogloss};")
+        print(f"validation:mlogloss_std={cv_mlogloss_std};")
+        print(f"validation:cv_rounds={num_round};")
+        print(f"{'='*60}\n")
+
+    # a warm start adds warm_start_rounds on top of the base model's rounds
+    resume_model = base_model
+    base_mlogloss = None
+    if base_model is not None:
+        num_round = base_model.num_boosted_rounds() + args.warm_start_rounds
+        print(f"Warm start - {args.warm_start_rounds} rounds on top of the base model")
+        if dval is not None:
+            base_mlogloss = float(base_model.eval(dval, 'validation').split(':')[-1])
+            print(f"validation:base_mlogloss={base_mlogloss};")
+
+    # resume a job interrupted (spot reclaim, restart) after its last checkpoint - it already holds the base model.
+    # only checkpoints written with the same params and training rows count, anything else is another run's
+    callbacks = [profiler]
+    start_round = resume_model.num_boosted_rounds() if resume_model is not None else 0
+    if args.checkpoint_interval > 0:
+        key = checkpoint_key(params, dtrain.num_row())
+        checkpoint = load_latest_checkpoint(args.checkpoint_dir, key)
+        if checkpoint is not None:
+            resume_model = checkpoint
+            start_round = min(checkpoint.num_boosted_rounds(), num_round)
+        callbacks.append(CheckpointCallback(args.checkpoint_dir, args.checkpoint_interval, key=key))
+
     print(f"Training with parameters: {params}")
-    print(f"Number of rounds: {args.num_round}\n")
+    print(f"Number of rounds: {num_round}")
+    if start_round:
+        print(f"Already trained: {start_round} - {num_round - start_round} rounds left")
+    print()
 
     evals_result = {}
 
+    # early stopping watches the last entry in evals, so it needs the validation channel
+    early_stopping_rounds = None
+    if args.early_stopping_rounds > 0 and not cross_validate:
+        if evals:
+            early_stopping_rounds = args.early_stopping_rounds
+            print(f"Early stopping after {early_stopping_rounds} rounds without improvement")
+        else:
+            print(f"WARNING: early_stopping_rounds ignored - no validation data")
+
     #model
+    train_start = time.perf_counter()
     model = xgb.train(
         params = params,
         dtrain = dtrain,
-        num_boost_round = args.num_round,
+        num_boost_round = num_round - start_round,
         evals = evals,
         evals_result = evals_result,
+        early_stopping_rounds = early_stopping_rounds,
+        xgb_model = resume_model,
+        callbacks = callbacks,
         verbose_eval = True #printing progress every 10 rounds
     )
+    train_seconds = time.perf_counter() - train_start
+
+    # keep only the trees up to the best round - the later ones made validation worse
+    best_iteration = None
+    if early_stopping_rounds:
+        best_iteration = model.best_iteration
+        model = model[: best_iteration + 1]
+        print(f"Best iteration: {best_iteration} - model truncated to {best_iteration + 1} rounds")
 
 
     # Claude - CRITICAL: Print metrics for SageMaker tuner
@@ -123,27 +354,50 @@ if __name__ == "__main__":
         # Calculate metrics
         val_accuracy = accuracy_score(y_val, y_pred_labels)
         
-        # Extract mlogloss from evals_result dictionary
-        final_mlogloss = evals_result['validation']['mlogloss'][-1]
+        # Extract mlogloss from evals_result dictionary - at the best round when the model was truncated.
+        # evals_result only covers the rounds of this run, so a resumed job may have to evaluate the model
+        history = evals_result.get('validation', {}).get('mlogloss', [])
+        final_round = len(history) - 1 if best_iteration is None else best_iteration - start_round
+        if 0 <= final_round < len(history):
+            final_mlogloss = history[final_round]
+        else:
+            final_mlogloss = float(model.eval(dval, 'validation').split(':')[-1])
         
         # CRITICAL: Print in format SageMaker expects
         print(f"validation:mlogloss={final_mlogloss};")
         print(f"validation:accuracy={val_accuracy}")
+        if best_iteration is not None:
+            print(f"validation:best_iteration={best_iteration};")
         
+        # what the warm start saved and cost - the same data trained from scratch for num_round rounds
+        if base_model is not None and args.compare_full_retrain:
+            retrain_start = time.perf_counter()
+            full_model = xgb.train(params = params, dtrain = dtrain, num_boost_round = args.num_round)
+            retrain_seconds = time.perf_counter() - retrain_start
+            full_mlogloss = float(full_model.eval(dval, 'validation').split(':')[-1])
+
+            print(f"validation:full_retrain_mlogloss={full_mlogloss};")
+            print(f"Warm start: mlogloss {final_mlogloss:.6f} in {train_seconds:.3f}s "
+                  f"(base model {base_mlogloss:.6f})")
+            print(f"Full retrain: mlogloss {full_mlogloss:.6f} in {retrain_seconds:.3f}s ({args.num_round} rounds)")
+
         print(f"\nValidation Accuracy: {val_accuracy:.6f}")
         print(f"Validation MLogloss: {final_mlogloss:.6f}")
         print(f"\nClassification Report:")
         print(classification_report(y_val, y_pred_labels))
         print(f"{'='*60}\n")
+    elif cross_validate:
+        print(f"Final model trained on train + validation for {num_round} rounds - metrics above are cross-validated")
     else:
         print(f"\n WARNING: No validation metrics computed!")
         print(f"   evals is empty: {len(evals) == 0}")
         print(f"   dval is None: {dval is None}\n")
 
     #saving model
-    os.makedirs(args.model_dir, exist_ok=True)
-    model_path = os.path.join(args.model_dir, "model.bst")
-    model.save_model(model_path)
+    model_path = save_model(model, args.model_dir, args.model_format)
 
     print(f"Model saved to {model_path}")
 
+    profile_dir = profiler.save(args.model_dir)
+    print(f"Training profile saved to {profile_dir}: {profiler.summary()}")
+
@@ -0,0 +1,109 @@
+# Tree ensemble read from an XGBoost JSON model - plain Python and NumPy, no xgboost import
+
+import json
+import numpy as np
+
+# the file train.py writes for model_format=json - the only format readable without xgboost
+MODEL_JSON_FILE = "model.json"
+
+# objective -> transform from summed margins to what Booster.predict returns
+OBJECTIVE_TRANSFORMS = {
+    "multi:softprob": "softmax",
+    "multi:softmax": "argmax",
+    "binary:logistic": "sigmoid",
+    "reg:squarederror": "identity"
+}
+
+
+class Tree:
+    """One regression tree as parallel per-node arrays. Leaves have left == -1 and their value in split_condition."""
+
+    def __init__(self, tree_json):
+        self.left = np.asarray(tree_json["left_children"], dtype=np.int32)
+        self.right = np.asarray(tree_json["right_children"], dtype=np.int32)
+        self.split_index = np.asarray(tree_json["split_indices"], dtype=np.int32)
+        self.split_condition = np.asarray(tree_json["split_conditions"], dtype=np.float32)
+        self.default_left = np.asarray(tree_json["default_left"], dtype=bool)
+
+        if any(tree_json.get("split_type", [])):
+            raise ValueError("Categorical splits are not supported")
+
+    def __len__(self):
+        return len(self.left)
+
+    def is_leaf(self, node):
+        return self.left[node] == -1
+
+
+class TreeEnsemble:
+    """
+    A gbtree model: trees, the output (class) each tree adds to, the base margin per output and the
+    objective. Margins are base_margin + the sum of the reached leaf values of each output's trees.
+    """
+
+    def __init__(self, trees, tree_group, base_margin, objective, num_feature):
+        self.trees = trees
+        self.tree_group = tree_group
+        self.base_margin = base_margin
+        self.objective = objective
+        self.num_feature = num_feature
+
+    @property
+    def num_output(self):
+        return len(self.base_margin)
+
+
+def parse_base_score(base_score, num_output, objective):
+    """
+    base_score as a margin per output. xgboost 1.7 stores one scalar ("5E-1"), later releases a vector
+    ("[...]"). It is kept in the objective's output space, so logistic models store a probability.
+    """
+    values = np.atleast_1d(np.asarray(json.loads(base_score), dtype=np.float64))
+    values = np.broadcast_to(values, (num_output,)).copy()
+
+    if objective == "binary:logistic":
+        values = np.log(values / (1.0 - values))
+    return values.astype(np.float32)
+
+
+def parse_model(model_json):
+    """TreeEnsemble from a parsed XGBoost JSON model (Booster.save_model("model.json") or save_raw("json"))."""
+    learner = model_json["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in OBJECTIVE_TRANSFORMS:
+        raise ValueError(f"Unsupported objective '{objective}', expected one of {list(OBJECTIVE_TRANSFORMS)}")
+
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise ValueError(f"Unsupported booster '{booster['name']}', only gbtree models can be converted")
+
+    model_param = learner["learner_model_param"]
+    num_output = max(int(model_param["num_class"]), 1)
+
+    return TreeEnsemble(
+        trees=[Tree(tree) for tree in booster["model"]["trees"]],
+        tree_group=np.asarray(booster["model"]["tree_info"], dtype=np.int32),
+        base_margin=parse_base_score(model_param["base_score"], num_output, objective),
+        objective=objective,
+        num_feature=int(model_param["num_feature"])
+    )
+
+
+def load_model_json(path):
+    """TreeEnsemble from a model.json file."""
+    with open(path) as f:
+        return parse_model(json.load(f))
+
+
+def transform(margins, objective):
+    """Applies the objective's output transform to an (n_rows, num_output) margin array."""
+    kind = OBJECTIVE_TRANSFORMS[objective]
+
+    if kind == "softmax":
+        exp = np.exp(margins - margins.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+    if kind == "argmax":
+        return margins.argmax(axis=1).astype(np.float32)
+    if kind == "sigmoid":
+        return 1.0 / (1.0 + np.exp(-margins[:, 0]))
+    return margins[:, 0]